@@ -1 +1,303 @@
 """The terneoax component."""
+import asyncio
+from datetime import timedelta
+import ipaddress
+import logging
+
+import voluptuous as vol
+from homeassistant.components.climate.const import (
+    ATTR_HVAC_MODE,
+    ATTR_PRESET_MODE,
+    HVAC_MODE_HEAT,
+    HVAC_MODE_OFF,
+    PRESET_AWAY,
+    PRESET_HOME,
+)
+from homeassistant.const import (
+    ATTR_TEMPERATURE,
+    CONF_DEVICES,
+    CONF_HOST,
+    CONF_NAME,
+    CONF_TIMEOUT,
+    EVENT_HOMEASSISTANT_STOP,
+)
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+import homeassistant.helpers.config_validation as cv
+
+from .const import (
+    DOMAIN,
+    DATA_SESSION,
+    DATA_COORDINATOR,
+    DATA_WARM_STATE,
+    DATA_NETWORKS,
+    DATA_ADDRESS_BOOK,
+    DATA_RECORDERS,
+    CONF_MIN_SCAN_INTERVAL,
+    CONF_MAX_SCAN_INTERVAL,
+    CONF_PARAMS_SCAN_INTERVAL,
+    CONF_NETWORK,
+    CONF_RECORD_TRAFFIC,
+    SERVICE_SET_FLEET,
+    ATTR_HOSTS,
+    ATTR_AWAY_DAYS,
+    STORAGE_KEY,
+    STORAGE_VERSION,
+    ADDRESSES_STORAGE_KEY,
+)
+from .coordinator import TerneoAXCoordinator, DEFAULT_MIN_INTERVAL, DEFAULT_MAX_INTERVAL
+from .discovery import TerneoAddressBook, async_scan_network
+from .recorder import TrafficRecorder
+from .terneo_api import AsyncTerneoAX, PARAMS_MAX_AGE, create_session
+
+# how often the coordinator looks for due thermostats; each device has its own adaptive interval
+TICK_INTERVAL = timedelta(seconds=5)
+
+# seconds to collect changes from the fleet before the warm state is written
+SAVE_DELAY = 60
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _network(value):
+    """Validate a CIDR range of addresses to scan."""
+    try:
+        return str(ipaddress.ip_network(value, strict=False))
+    except ValueError as ex:
+        raise vol.Invalid("invalid network {}: {}".format(value, ex))
+
+
+DEVICE_SCHEMA = vol.Any(
+    vol.All(cv.string, lambda host: {CONF_HOST: host}),
+    vol.Schema({vol.Required(CONF_HOST): cv.string, vol.Optional(CONF_NAME): cv.string}),
+)
+
+# options selecting thermostats, shared by the climate, sensor and binary_sensor platforms;
+# a platform block names one host, a list of devices or a network to scan
+DEVICE_SCHEMA_FIELDS = {
+    vol.Optional(CONF_HOST): cv.string,
+    vol.Optional(CONF_DEVICES): vol.All(cv.ensure_list, [DEVICE_SCHEMA]),
+    vol.Optional(CONF_NETWORK): _network,
+    vol.Optional(CONF_TIMEOUT, default=5): vol.All(
+        vol.Coerce(int), vol.Range(min=1)
+    ),
+    vol.Optional(CONF_NAME): cv.string,
+    vol.Optional(CONF_MIN_SCAN_INTERVAL, default=DEFAULT_MIN_INTERVAL): vol.All(
+        vol.Coerce(int), vol.Range(min=5)
+    ),
+    vol.Optional(CONF_MAX_SCAN_INTERVAL, default=DEFAULT_MAX_INTERVAL): vol.All(
+        vol.Coerce(int), vol.Range(min=5)
+    ),
+    # params are read early when telemetry shows they were changed on the device
+    vol.Optional(CONF_PARAMS_SCAN_INTERVAL, default=PARAMS_MAX_AGE): vol.All(
+        vol.Coerce(int), vol.Range(min=15)
+    ),
+    # file, relative to the config directory, to append the raw device traffic to
+    vol.Optional(CONF_RECORD_TRAFFIC): cv.string,
+}
+
+
+SET_FLEET_SCHEMA = vol.All(
+    vol.Schema({
+        vol.Optional(ATTR_HOSTS): vol.All(cv.ensure_list, [cv.string]),
+        vol.Optional(ATTR_TEMPERATURE): vol.Coerce(float),
+        vol.Optional(ATTR_HVAC_MODE): vol.In([HVAC_MODE_HEAT, HVAC_MODE_OFF]),
+        vol.Optional(ATTR_PRESET_MODE): vol.In([PRESET_HOME, PRESET_AWAY]),
+        vol.Optional(ATTR_AWAY_DAYS, default=30): vol.All(vol.Coerce(int), vol.Range(min=1)),
+    }),
+    cv.has_at_least_one_key(ATTR_TEMPERATURE, ATTR_HVAC_MODE, ATTR_PRESET_MODE),
+)
+
+
+def device_platform_schema(schema):
+    """Require at least one way of naming thermostats in a platform schema."""
+    return vol.All(schema, cv.has_at_least_one_key(CONF_HOST, CONF_DEVICES, CONF_NETWORK))
+
+
+def async_get_session(hass):
+    """Return the keep-alive session shared by all thermostats."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_SESSION not in data:
+        session = create_session()
+        data[DATA_SESSION] = session
+
+        async def _async_close_session(_event):
+            await session.close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_close_session)
+    return data[DATA_SESSION]
+
+
+def async_get_coordinator(hass) -> TerneoAXCoordinator:
+    """Return the coordinator polling every thermostat, starting it on first use."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_COORDINATOR not in data:
+        coordinator = TerneoAXCoordinator()
+        data[DATA_COORDINATOR] = coordinator
+        remove_timer = async_track_time_interval(hass, coordinator.async_refresh, TICK_INTERVAL)
+
+        def _stop_polling(_event):
+            remove_timer()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _stop_polling)
+        hass.services.async_register(
+            DOMAIN, SERVICE_SET_FLEET, _async_set_fleet_handler(coordinator), schema=SET_FLEET_SCHEMA
+        )
+    return data[DATA_COORDINATOR]
+
+
+def _async_set_fleet_handler(coordinator: TerneoAXCoordinator):
+    """Build the set_fleet service: one mode, preset or setpoint change written to many thermostats."""
+
+    def _change(call):
+        hvac_mode = call.data.get(ATTR_HVAC_MODE)
+        preset_mode = call.data.get(ATTR_PRESET_MODE)
+        temperature = call.data.get(ATTR_TEMPERATURE)
+
+        def _apply(client: AsyncTerneoAX) -> bool:
+            success = True
+            if hvac_mode is not None:
+                success &= client.set_mode(client.MODE_HEAT if hvac_mode == HVAC_MODE_HEAT else client.MODE_OFF)
+            # the preset goes first, the setpoint is written to the away or the manual temperature
+            if preset_mode == PRESET_AWAY:
+                success &= client.set_away(3600 * 24 * call.data[ATTR_AWAY_DAYS])
+            elif preset_mode == PRESET_HOME:
+                success &= client.set_home()
+            if temperature is not None:
+                success &= client.set_temp_setting(int(temperature))
+            return success
+
+        return _apply
+
+    async def _async_set_fleet(call):
+        results = await coordinator.async_apply(_change(call), call.data.get(ATTR_HOSTS))
+        failed = [addr for addr, success in results.items() if not success]
+        if failed:
+            _LOGGER.error("Failed to change {} of {} thermostats: {}".format(
+                len(failed), len(results), ", ".join(failed)))
+        else:
+            _LOGGER.info("Changed {} thermostats".format(len(results)))
+
+    return _async_set_fleet
+
+
+def async_get_recorder(hass, path) -> TrafficRecorder:
+    """Return the traffic recorder writing to path, shared by the thermostats recorded there."""
+    recorders = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_RECORDERS, {})
+    path = hass.config.path(path)
+    if path not in recorders:
+        recorder = TrafficRecorder(path)
+        recorders[path] = recorder
+
+        async def _async_close_recorder(_event):
+            await hass.async_add_executor_job(recorder.close)
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _async_close_recorder)
+    return recorders[path]
+
+
+async def _async_get_warm_state(hass):
+    """Load the stored client state once, returning the store and the per-address data."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_WARM_STATE not in data:
+        store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+
+        async def _async_load():
+            return store, await store.async_load() or {}
+
+        data[DATA_WARM_STATE] = hass.async_create_task(_async_load())
+    return await data[DATA_WARM_STATE]
+
+
+async def _async_get_address_book(hass):
+    """Load the serial number to address map once, returning its store and the TerneoAddressBook.
+
+    The coordinator uses the address book to find thermostats that moved.
+    """
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_ADDRESS_BOOK not in data:
+        store = Store(hass, STORAGE_VERSION, ADDRESSES_STORAGE_KEY)
+
+        async def _async_load():
+            address_book = TerneoAddressBook(await store.async_load())
+            async_get_coordinator(hass).resolver = address_book.async_resolve
+            return store, address_book
+
+        data[DATA_ADDRESS_BOOK] = hass.async_create_task(_async_load())
+    return await data[DATA_ADDRESS_BOOK]
+
+
+async def async_get_client(hass, config) -> AsyncTerneoAX:
+    """Return the client of the configured thermostat, shared by all its entities.
+
+    A new client is seeded from the warm state saved before the last restart
+    and refreshed in the background, so entities can be added without waiting
+    for the device.
+    """
+    coordinator = async_get_coordinator(hass)
+    client = coordinator.get_client(config[CONF_HOST])
+    if client is not None:
+        return client
+
+    host = config[CONF_HOST]
+    store, warm_state = await _async_get_warm_state(hass)
+    address_store, address_book = await _async_get_address_book(hass)
+    client = coordinator.get_client(host)
+    if client is not None:
+        return client
+    client = coordinator.add_client(
+        AsyncTerneoAX(
+            addr=config[CONF_HOST],
+            timeout=config[CONF_TIMEOUT],
+            name=config.get(CONF_NAME),
+            params_interval=config[CONF_PARAMS_SCAN_INTERVAL],
+            session=async_get_session(hass),
+        ),
+        min_interval=config[CONF_MIN_SCAN_INTERVAL],
+        max_interval=config[CONF_MAX_SCAN_INTERVAL],
+    )
+    if CONF_RECORD_TRAFFIC in config:
+        client.recorder = async_get_recorder(hass, config[CONF_RECORD_TRAFFIC])
+    if host in warm_state:
+        client.restore_state(warm_state[host])
+        # a thermostat that moved before the restart is polled where it was last seen
+        client.addr = address_book.lookup(client._sn) or host
+
+    def _save_warm_state():
+        state = client.export_state()
+        if state != warm_state.get(host):
+            warm_state[host] = state
+            store.async_delay_save(lambda: warm_state, SAVE_DELAY)
+        if client.last_update_success and address_book.learn(client._sn, client.addr):
+            address_store.async_delay_save(lambda: address_book.addresses, SAVE_DELAY)
+
+    coordinator.async_add_listener(client, _save_warm_state)
+    hass.async_create_task(coordinator.async_refresh_client(client))
+    return client
+
+
+async def _async_scan(hass, network):
+    """Scan network once, sharing the result between the platforms that name it."""
+    scans = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_NETWORKS, {})
+    if network not in scans:
+        scans[network] = hass.async_create_task(async_scan_network(network))
+    return await scans[network]
+
+
+async def async_get_clients(hass, config) -> list:
+    """Return the clients of every thermostat named by a platform config."""
+    devices = []
+    if CONF_HOST in config:
+        devices.append({CONF_HOST: config[CONF_HOST], CONF_NAME: config.get(CONF_NAME)})
+    devices.extend(config.get(CONF_DEVICES, []))
+    if CONF_NETWORK in config:
+        _, address_book = await _async_get_address_book(hass)
+        address_book.networks.add(config[CONF_NETWORK])
+        known = {device[CONF_HOST] for device in devices}
+        found = await _async_scan(hass, config[CONF_NETWORK])
+        devices.extend({CONF_HOST: addr} for addr in sorted(found, key=ipaddress.ip_address) if addr not in known)
+
+    return await asyncio.gather(*(
+        async_get_client(hass, {**config, CONF_HOST: device[CONF_HOST], CONF_NAME: device.get(CONF_NAME)})
+        for device in devices
+    ))
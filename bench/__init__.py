@@ -0,0 +1,17 @@
+"""Benchmarks of the TerneoAX client against simulated thermostats."""
+import importlib
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PACKAGE = "terneoax"
+
+
+def load_api():
+    """Import terneo_api without the Home Assistant glue of the package __init__."""
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [str(ROOT)]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(PACKAGE + ".terneo_api")
@@ -0,0 +1,187 @@
+"""Measure TerneoAX update cost against the local device simulator.
+
+Starts bench/simulator.py in a subprocess, so its CPU time is not counted,
+and refreshes fleets of 1, 10 and 200 devices for a number of rounds:
+
+    python bench/run.py --latency 0.02 --rounds 20 --write-rate 0.1
+
+For every fleet size it reports p50/p99 latency of one device update,
+requests per update and client CPU time per update. The first round, which
+reads params and schedule of every device, is reported separately as "cold".
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from bench import load_api
+except ImportError:  # run as a script
+    sys.path.insert(0, str(__import__("pathlib").Path(__file__).resolve().parent.parent))
+    from bench import load_api
+
+api = load_api()
+
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator.py")
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class CountingTerneoAX(api.TerneoAX):
+    requests = 0
+
+    def _request(self, path, data=None):
+        self.requests += 1
+        return super()._request(path, data)
+
+
+class CountingAsyncTerneoAX(api.AsyncTerneoAX):
+    requests = 0
+
+    async def _send(self, path, data=None):
+        self.requests += 1
+        return await super()._send(path, data)
+
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.requests = 0
+        self.cpu = 0.0
+        self.failures = 0
+
+    @property
+    def updates(self):
+        return len(self.latencies)
+
+    def row(self, label, devices):
+        updates = self.updates or 1
+        return "{:>7} {:>5} {:>8} {:>10.2f} {:>10.2f} {:>9.2f} {:>11.3f} {:>8}".format(
+            devices, label, self.updates, percentile(self.latencies, 50) * 1000,
+            percentile(self.latencies, 99) * 1000, self.requests / updates, self.cpu / updates * 1000, self.failures)
+
+
+HEADER = "{:>7} {:>5} {:>8} {:>10} {:>10} {:>9} {:>11} {:>8}".format(
+    "devices", "phase", "updates", "p50 ms", "p99 ms", "req/upd", "cpu ms/upd", "failed")
+
+
+def _change_setpoints(clients, rate, rng):
+    for client in clients:
+        if rng.random() < rate:
+            client.set_param("manualFloorTemperature", rng.randint(18, 30))
+
+
+def _collect(result, clients, before_requests, cpu, samples):
+    result.cpu += cpu
+    result.requests += sum(client.requests for client in clients) - before_requests
+    for elapsed, ok in samples:
+        result.latencies.append(elapsed)
+        result.failures += not ok
+
+
+async def run_async(addresses, rounds, interval, write_rate, timeout, rng):
+    session = api.create_session()
+    clients = [CountingAsyncTerneoAX(addr, timeout=timeout, session=session) for addr in addresses]
+
+    async def _timed(client):
+        start = time.perf_counter()
+        ok = await client.refresh()
+        return time.perf_counter() - start, ok
+
+    results = {"cold": Result(), "warm": Result()}
+    try:
+        for index in range(rounds):
+            if index:
+                _change_setpoints(clients, write_rate, rng)
+            before = sum(client.requests for client in clients)
+            cpu = time.process_time()
+            samples = await asyncio.gather(*(_timed(client) for client in clients))
+            _collect(results["warm" if index else "cold"], clients, before, time.process_time() - cpu, samples)
+            await asyncio.sleep(interval)
+    finally:
+        await session.close()
+    return results
+
+
+def run_sync(addresses, rounds, interval, write_rate, timeout, rng):
+    clients = [CountingTerneoAX(addr, timeout=timeout) for addr in addresses]
+
+    def _timed(client):
+        start = time.perf_counter()
+        ok = client.refresh()
+        return time.perf_counter() - start, ok
+
+    results = {"cold": Result(), "warm": Result()}
+    with ThreadPoolExecutor(max_workers=min(len(clients), api.DEFAULT_MAX_IN_FLIGHT)) as executor:
+        for index in range(rounds):
+            if index:
+                _change_setpoints(clients, write_rate, rng)
+            before = sum(client.requests for client in clients)
+            cpu = time.process_time()
+            samples = list(executor.map(_timed, clients))
+            _collect(results["warm" if index else "cold"], clients, before, time.process_time() - cpu, samples)
+            time.sleep(interval)
+    for client in clients:
+        client.close()
+    return results
+
+
+def start_simulator(args, devices, base_port):
+    cmd = [sys.executable, SIMULATOR, "--devices", str(devices), "--base-port", str(base_port),
+           "--latency", str(args.latency), "--jitter", str(args.jitter),
+           "--failure-rate", str(args.failure_rate), "--timeout-rate", str(args.timeout_rate),
+           "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    line = proc.stdout.readline().split()
+    if not line or line[0] != "ready":
+        proc.kill()
+        raise RuntimeError("simulator failed to start")
+    host, ports = line[1], line[2:]
+    return proc, ["{}:{}".format(host, port) for port in ports]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 200])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.1, help="pause between rounds in seconds")
+    parser.add_argument("--write-rate", type=float, default=0.0,
+                        help="share of devices that get a new setpoint before each warm round")
+    parser.add_argument("--client", choices=["async", "sync"], default="async")
+    parser.add_argument("--timeout", type=float, default=5)
+    parser.add_argument("--base-port", type=int, default=18000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(HEADER)
+    for devices in args.devices:
+        proc, addresses = start_simulator(args, devices, args.base_port)
+        rng = random.Random(args.seed)
+        try:
+            if args.client == "async":
+                results = asyncio.run(run_async(addresses, args.rounds, args.interval, args.write_rate,
+                                                args.timeout, rng))
+            else:
+                results = run_sync(addresses, args.rounds, args.interval, args.write_rate, args.timeout, rng)
+        finally:
+            proc.terminate()
+            proc.wait()
+        for label, result in results.items():
+            print(result.row(label, devices), flush=True)
+
+
+if __name__ == "__main__":
+    main()
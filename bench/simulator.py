@@ -0,0 +1,183 @@
+"""Local simulator of the Terneo AX ``api.cgi`` for many virtual thermostats.
+
+Each virtual device listens on its own port of one aiohttp application and
+answers cmd:1 (params), cmd:2 (schedule) and cmd:4 (telemetry) requests and
+"par" writes with the parameter and telemetry ids of terneo_api.
+
+    python bench/simulator.py --devices 200 --base-port 18000 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+
+from aiohttp import web
+
+try:
+    from bench import load_api
+except ImportError:  # run as a script
+    sys.path.insert(0, str(__import__("pathlib").Path(__file__).resolve().parent.parent))
+    from bench import load_api
+
+api = load_api()
+
+DEFAULT_PARAMS = {
+    "startAwayTime": 536112000,
+    "endAwayTime": 536112000,
+    "mode": 1,
+    "manualFloorTemperature": 28,
+    "awayFloorTemperature": 12,
+    "power": 100,
+    "upperLimit": 45,
+    "lowerLimit": 5,
+    "maxSchedulePeriod": 4,
+    "histeresis": 5,
+}
+
+DEFAULT_SCHEDULE = {str(day): [[360, 280], [480, 200], [1080, 280], [1380, 200]] for day in range(7)}
+
+
+class VirtualThermostat:
+    """State and request handling of one simulated device."""
+
+    def __init__(self, sn, rng: random.Random):
+        self.sn = sn
+        self.rng = rng
+        self.params = {param_id: [param_type, DEFAULT_PARAMS.get(name, 0)]
+                       for param_id, (name, param_type) in api.terneo_params_map.items()}
+        self.schedule = DEFAULT_SCHEDULE
+        self.floor = 20.0 + rng.random() * 5
+        self.load = 0
+        self.requests = 0
+
+    def _param(self, name):
+        param_id, _ = api.terneo_params_rev_map[name]
+        return self.params[param_id][1]
+
+    def _step(self):
+        setting = self._param("manualFloorTemperature")
+        if self._param("powerOff"):
+            self.load = 0
+        elif self.floor < setting - 0.5:
+            self.load = 1
+        elif self.floor > setting + 0.5:
+            self.load = 0
+        self.floor += (0.1 if self.load else -0.05) + self.rng.uniform(-0.02, 0.02)
+
+    def telemetry(self):
+        self._step()
+        setting = self._param("manualFloorTemperature")
+        values = {
+            "floorSensor": round(self.floor * 16),
+            "airSensor": round((self.floor - 2) * 16),
+            "currentSetting": setting * 16,
+            "supplyVoltage": 23000 + self.rng.randint(-300, 300),
+            "averageCurrent": 60 * self.load,
+            "averageLoadPower": 1500 * self.load,
+            "avgCosinePhi": 99,
+            "typeOfManagement": 3 if self._param("mode") else 0,
+            "numberPeriodOfSchedule": 0,
+            "lockType": 0,
+            "wifiSignalLevel": -50 + self.rng.randint(-5, 5),
+            "loadCondition": self.load,
+        }
+        data = {key: str(values.get(name, 0)) for key, (name, _) in api.terneo_telemetry_map.items()}
+        data["sn"] = self.sn
+        return data
+
+    def handle(self, payload):
+        self.requests += 1
+        if "par" in payload:
+            for param_id, param_type, value in payload["par"]:
+                if param_id in self.params:
+                    self.params[param_id] = [param_type, int(value) if param_type else value]
+            return {"success": "true"}
+        cmd = payload.get("cmd")
+        if cmd == 1:
+            params = [[param_id, param_type, str(value)] for param_id, (param_type, value) in self.params.items()]
+            return {"sn": self.sn, "par": params}
+        if cmd == 2:
+            return {"sn": self.sn, "tt": self.schedule}
+        if cmd == 4:
+            return self.telemetry()
+        return {"status": "error"}
+
+
+class Simulator:
+    """Serve many virtual thermostats from one process on consecutive ports."""
+
+    def __init__(self, devices, base_port, host="127.0.0.1", latency=0.0, jitter=0.0,
+                 failure_rate=0.0, timeout_rate=0.0, seed=0):
+        self.host = host
+        self.base_port = base_port
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.rng = random.Random(seed)
+        self.devices = {base_port + i: VirtualThermostat("SIM{:07d}".format(i), random.Random(seed + i))
+                        for i in range(devices)}
+        self._runner = None
+
+    @property
+    def addresses(self):
+        return ["{}:{}".format(self.host, port) for port in self.devices]
+
+    async def _handle(self, request):
+        device = self.devices[request.transport.get_extra_info("sockname")[1]]
+        payload = json.loads(await request.read() or b"{}")
+        roll = self.rng.random()
+        if roll < self.timeout_rate:
+            await asyncio.sleep(3600)
+        delay = self.latency + self.rng.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if roll < self.timeout_rate + self.failure_rate:
+            return web.Response(status=500)
+        return web.json_response(device.handle(payload))
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/api.cgi", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        for port in self.devices:
+            await web.TCPSite(self._runner, self.host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--base-port", type=int, default=18000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with HTTP 500")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of requests never answered")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    async def _serve():
+        simulator = Simulator(args.devices, args.base_port, args.host, args.latency, args.jitter,
+                              args.failure_rate, args.timeout_rate, args.seed)
+        await simulator.start()
+        print("ready {} {}".format(args.host, " ".join(str(port) for port in simulator.devices)), flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await simulator.stop()
+
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Telemetry flags of TerneoAX thermostats."""
+import voluptuous as vol
+
+from homeassistant.components.binary_sensor import (
+    DEVICE_CLASS_HEAT,
+    DEVICE_CLASS_PROBLEM,
+    DEVICE_CLASS_WINDOW,
+    PLATFORM_SCHEMA,
+    BinarySensorEntity,
+)
+from homeassistant.const import CONF_MONITORED_CONDITIONS
+import homeassistant.helpers.config_validation as cv
+
+from . import DEVICE_SCHEMA_FIELDS, async_get_clients, async_get_coordinator, device_platform_schema
+from .coordinator import TerneoAXCoordinator
+from .entity import TerneoAXEntity
+from .terneo_api import AsyncTerneoAX
+
+# telemetry flag: (name suffix, device class)
+BINARY_SENSOR_TYPES = {
+    "loadCondition": ("heating", DEVICE_CLASS_HEAT),
+    "preheatingAction": ("preheating", DEVICE_CLASS_HEAT),
+    "openWindowAction": ("open window", DEVICE_CLASS_WINDOW),
+    "floorSensorBreak": ("floor sensor break", DEVICE_CLASS_PROBLEM),
+    "floorSensorShortCircuit": ("floor sensor short circuit", DEVICE_CLASS_PROBLEM),
+    "airSensorBreak": ("air sensor break", DEVICE_CLASS_PROBLEM),
+    "airSensorShortCircuit": ("air sensor short circuit", DEVICE_CLASS_PROBLEM),
+    "internalOverheating": ("internal overheating", DEVICE_CLASS_PROBLEM),
+    "batteryLow": ("battery low", DEVICE_CLASS_PROBLEM),
+    "clockProblem": ("clock problem", DEVICE_CLASS_PROBLEM),
+}
+
+PLATFORM_SCHEMA = device_platform_schema(PLATFORM_SCHEMA.extend(
+    {
+        **DEVICE_SCHEMA_FIELDS,
+        vol.Optional(CONF_MONITORED_CONDITIONS, default=list(BINARY_SENSOR_TYPES)): vol.All(
+            cv.ensure_list, [vol.In(BINARY_SENSOR_TYPES)]
+        ),
+    }
+))
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the TerneoAX telemetry flags."""
+
+    coordinator = async_get_coordinator(hass)
+    clients = await async_get_clients(hass, config)
+
+    async_add_entities(
+        [
+            TerneoAXTelemetryFlag(client, coordinator, field)
+            for client in clients
+            for field in config[CONF_MONITORED_CONDITIONS]
+        ]
+    )
+
+
+class TerneoAXTelemetryFlag(TerneoAXEntity, BinarySensorEntity):
+    """One telemetry flag of a thermostat, read from the shared cmd:4 response."""
+
+    def __init__(self, client: AsyncTerneoAX, coordinator: TerneoAXCoordinator, field):
+        """Initialize the binary sensor."""
+        super().__init__(client, coordinator)
+        self._field = field
+
+    @property
+    def name(self):
+        """Return the name of the binary sensor."""
+        return "{} {}".format(self._client.name, BINARY_SENSOR_TYPES[self._field][0])
+
+    @property
+    def is_on(self):
+        """Return True if the flag is set."""
+        value = self._client._telemetry_value(self._field)
+        if value is None:
+            return None
+        return value != 0
+
+    @property
+    def device_class(self):
+        """Return the device class of the binary sensor."""
+        return BINARY_SENSOR_TYPES[self._field][1]
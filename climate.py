@@ -1,9 +1,13 @@
 """Support for TerneoAX WiFi Thermostats. http://www.terneo.ua """
 import logging
 from typing import Optional
-from .terneo_api import TerneoAX
-import voluptuous as vol
+from . import DEVICE_SCHEMA_FIELDS, async_get_clients, async_get_coordinator, device_platform_schema
+from .coordinator import TerneoAXCoordinator
+from .entity import TerneoAXEntity
+from .terneo_api import AsyncTerneoAX
 from homeassistant.helpers.typing import HomeAssistantType
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
 
 from homeassistant.components.climate import ClimateEntity, PLATFORM_SCHEMA
 
@@ -20,64 +24,65 @@ from homeassistant.components.climate.const import (
     PRESET_HOME,
 )
 from homeassistant.const import (
-    CONF_NAME,
     ATTR_TEMPERATURE,
-    CONF_HOST,
-    CONF_TIMEOUT,
     PRECISION_TENTHS,
     TEMP_CELSIUS,
 )
-import homeassistant.helpers.config_validation as cv
 
 _LOGGER = logging.getLogger(__name__)
 
 ATTR_HVAC_STATE = "hvac_mode"
+ATTR_NEXT_TRANSITION = "next_transition"
+ATTR_NEXT_TEMPERATURE = "next_temperature"
+ATTR_STALE = "stale"
 
 VALID_THERMOSTAT_MODES = [HVAC_MODE_HEAT, HVAC_MODE_OFF]
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
-    {
-        vol.Required(CONF_HOST): cv.string,
-        vol.Optional(CONF_TIMEOUT, default=5): vol.All(
-            vol.Coerce(int), vol.Range(min=1)
-        ),
-        vol.Optional(CONF_NAME): cv.string,
-    }
-)
+PLATFORM_SCHEMA = device_platform_schema(PLATFORM_SCHEMA.extend(DEVICE_SCHEMA_FIELDS))
 
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
-    """Set up the TerneoAX thermostat."""
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the TerneoAX thermostats."""
 
-    host = config.get(CONF_HOST)
-    timeout = config.get(CONF_TIMEOUT)
-    name = config.get(CONF_NAME)
-    client = TerneoAX(
-        addr=host, timeout=timeout, name=name
-    )
+    coordinator = async_get_coordinator(hass)
+    clients = await async_get_clients(hass, config)
 
-    add_entities([TerneoAXThermostat(client, hass)], True)
+    # shown from the warm state at once, the clients refresh in the background
+    async_add_entities([TerneoAXThermostat(client, coordinator, hass) for client in clients])
 
 
-class TerneoAXThermostat(ClimateEntity):
+class TerneoAXThermostat(TerneoAXEntity, ClimateEntity):
     """Representation of a TerneoAX thermostat."""
 
-    def __init__(self, client: TerneoAX, hass: HomeAssistantType):
+    def __init__(self, client: AsyncTerneoAX, coordinator: TerneoAXCoordinator, hass: HomeAssistantType):
         """Initialize the thermostat."""
-        self._client = client
+        super().__init__(client, coordinator)
         self._notification_send = False
         self._hass = hass
+        self._settle_unsub = None
 
-    def update(self):
+    async def async_update(self):
         """Update the data from the thermostat."""
-        _LOGGER.info("Update: {}".format(self._client.addr))
-        if not self._client.update_params():
-            _LOGGER.error("Failed to update params")
-        if not self._client.update_telemetry():
-            _LOGGER.error("Failed to update telemetry")
-        else:
+        await super().async_update()
+        if self._remove_listener is None:
+            # not subscribed yet, the refresh before adding is handled here
+            self._process_update()
+
+    def _published_value(self):
+        """Return the snapshot the written state is built from."""
+        return self.available, self._client.stale, self._client.snapshot
+
+    @callback
+    def _handle_update(self):
+        """Publish the snapshot the coordinator has just fetched, if it differs."""
+        self._process_update()
+        super()._handle_update()
+
+    def _process_update(self):
+        """React to a finished refresh of the client."""
+        if self._client.last_update_success:
             if not self._notification_send and not self._client.is_local_lan_remote_control_enabled():
-                self._hass.components.persistent_notification.create(
+                self._hass.components.persistent_notification.async_create(
                     "Please enable remote control on {} [{}] serial number: {} ".format(self._client.addr,
                                                                                         self._client.name,
                                                                                         self._client._sn),
@@ -85,7 +90,38 @@ class TerneoAXThermostat(ClimateEntity):
                     self._client._sn
                 )
                 self._notification_send = True
-        _LOGGER.info("Update: {} done".format(self._client.addr))
+        self._schedule_settle_refresh()
+
+    def _schedule_settle_refresh(self):
+        """Re-poll once the thermostat has applied the last write."""
+        delay = self._client.settle_delay
+        if delay is None or self._settle_unsub is not None:
+            return
+        self._settle_unsub = async_call_later(self._hass, delay, self._async_settled)
+
+    async def _async_settled(self, _now):
+        """Run the post-write params read."""
+        self._settle_unsub = None
+        await self._coordinator.async_refresh_client(self._client)
+
+    def _queue_write(self):
+        """Send the changed params in the client's next batched write."""
+        self._client.queue_write().add_done_callback(self._write_done)
+        self._publish()
+
+    @callback
+    def _write_done(self, future):
+        """Report a failed write and re-read the params once it settled."""
+        if future.cancelled() or not future.result():
+            _LOGGER.error("Failed to write params to {}".format(self._client.addr))
+        self._schedule_settle_refresh()
+
+    async def async_will_remove_from_hass(self):
+        """Stop listening and cancel a pending post-write refresh."""
+        await super().async_will_remove_from_hass()
+        if self._settle_unsub is not None:
+            self._settle_unsub()
+            self._settle_unsub = None
 
     @property
     def supported_features(self):
@@ -122,52 +158,60 @@ class TerneoAXThermostat(ClimateEntity):
     @property
     def current_temperature(self):
         """Return the current temperature."""
-        return self._client.get_current_temp()
+        return self._client.snapshot.current_temperature
 
     @property
     def hvac_mode(self):
         """Return current operation mode ie. heat, cool, auto."""
-        if self._client.mode == self._client.MODE_HEAT:
+        if self._client.snapshot.mode == self._client.MODE_HEAT:
             return HVAC_MODE_HEAT
         return HVAC_MODE_OFF
 
     @property
     def hvac_action(self):
         """Return current operation mode ie. heat, cool, auto."""
-        if self._client.state == self._client.STATE_IDLE:
+        state = self._client.snapshot.state
+        if state == self._client.STATE_IDLE:
             return CURRENT_HVAC_IDLE
-        if self._client.state == self._client.STATE_HEATING:
+        if state == self._client.STATE_HEATING:
             return CURRENT_HVAC_HEAT
         return CURRENT_HVAC_OFF
 
     @property
     def device_state_attributes(self):
         """Return the optional state attributes."""
-        return {
-            ATTR_HVAC_STATE: self._client.state,
+        snapshot = self._client.snapshot
+        attributes = {
+            ATTR_HVAC_STATE: snapshot.state,
+            ATTR_STALE: self._client.stale,
         }
+        if snapshot.next_transition is not None:
+            attributes[ATTR_NEXT_TRANSITION] = snapshot.next_transition[0].isoformat()
+            attributes[ATTR_NEXT_TEMPERATURE] = snapshot.next_transition[1]
+        return attributes
 
     @property
     def target_temperature(self):
         """Return the target temperature we try to reach."""
-        if self._client.mode == self._client.MODE_HEAT:
-            return self._client.heattemp
+        snapshot = self._client.snapshot
+        if snapshot.mode in (self._client.MODE_HEAT, self._client.MODE_SCHEDULE):
+            return snapshot.target_temperature
         return None
 
     @property
     def min_temp(self) -> float:
         """Return the minimum temperature."""
-        return self._client.get_lower_temp_limit()
+        return self._client.snapshot.min_temperature
 
     @property
     def max_temp(self) -> float:
         """Return the maximum temperature."""
-        return self._client.get_upper_temp_limit()
+        return self._client.snapshot.max_temperature
 
     @property
     def preset_mode(self):
         """Return current preset."""
-        if self._client.away:
+        if self._client.snapshot.away:
             return PRESET_AWAY
         return PRESET_HOME
 
@@ -187,9 +231,9 @@ class TerneoAXThermostat(ClimateEntity):
             _LOGGER.error("Failed to change the operation mode {mode}".format(mode=operation_mode))
         return success
 
-    def set_temperature(self, **kwargs) -> None:
+    async def async_set_temperature(self, **kwargs) -> None:
         """Set a new target temperature."""
-        set_temp = True
+        mode_changed = False
         operation_mode = kwargs.get(ATTR_HVAC_MODE, self._client.mode)
         temperature = kwargs.get(ATTR_TEMPERATURE)
 
@@ -197,28 +241,32 @@ class TerneoAXThermostat(ClimateEntity):
             "Set temperature mode:{mode} t:{temp} ".format(mode=operation_mode, temp=temperature))
 
         if operation_mode != self._client.mode:
-            set_temp = self._set_operation_mode(operation_mode)
-
-        if set_temp:
-            if operation_mode == self._client.MODE_HEAT:
-                success = self._client.set_temp_setting(int(temperature))
-            else:
-                success = False
-                _LOGGER.error(
-                    "The thermostat is currently not in a mode "
-                    "that supports target temperature: %s",
-                    operation_mode,
-                )
+            if not self._set_operation_mode(operation_mode):
+                return
+            mode_changed = True
+
+        if operation_mode == self._client.MODE_HEAT:
+            success = self._client.set_temp_setting(int(temperature))
+        else:
+            success = False
+            _LOGGER.error(
+                "The thermostat is currently not in a mode "
+                "that supports target temperature: %s",
+                operation_mode,
+            )
 
-            if not success:
-                _LOGGER.error("Failed to change the temperature")
+        if not success:
+            _LOGGER.error("Failed to change the temperature")
+        if success or mode_changed:
+            self._queue_write()
 
-    def set_hvac_mode(self, hvac_mode) -> None:
+    async def async_set_hvac_mode(self, hvac_mode) -> None:
         """Set new target operation mode."""
         _LOGGER.info("Set mode: {}".format(hvac_mode))
-        self._set_operation_mode(hvac_mode)
+        if self._set_operation_mode(hvac_mode):
+            self._queue_write()
 
-    def set_preset_mode(self, preset_mode) -> None:
+    async def async_set_preset_mode(self, preset_mode) -> None:
         """Set the hold mode."""
         _LOGGER.info("Set home/away: {}".format(preset_mode))
         if preset_mode == PRESET_AWAY:
@@ -231,3 +279,5 @@ class TerneoAXThermostat(ClimateEntity):
 
         if not success:
             _LOGGER.error("Failed to change the home/away state {}".format(preset_mode))
+        else:
+            self._queue_write()
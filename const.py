@@ -0,0 +1,24 @@
+"""Constants for the TerneoAX integration."""
+
+DOMAIN = "terneoax"
+
+DATA_SESSION = "session"
+DATA_COORDINATOR = "coordinator"
+DATA_WARM_STATE = "warm_state"
+DATA_NETWORKS = "networks"
+DATA_ADDRESS_BOOK = "address_book"
+DATA_RECORDERS = "recorders"
+
+STORAGE_KEY = DOMAIN + ".warm_state"
+ADDRESSES_STORAGE_KEY = DOMAIN + ".addresses"
+STORAGE_VERSION = 1
+
+CONF_MIN_SCAN_INTERVAL = "min_scan_interval"
+CONF_MAX_SCAN_INTERVAL = "max_scan_interval"
+CONF_PARAMS_SCAN_INTERVAL = "params_scan_interval"
+CONF_NETWORK = "network"
+CONF_RECORD_TRAFFIC = "record_traffic"
+
+SERVICE_SET_FLEET = "set_fleet"
+ATTR_HOSTS = "hosts"
+ATTR_AWAY_DAYS = "away_days"
@@ -0,0 +1,224 @@
+"""Fleet-wide polling of TerneoAX thermostats."""
+import asyncio
+import logging
+from time import time
+from typing import Callable
+
+from .terneo_api import AsyncTerneoAX, CircuitBreaker
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_MIN_INTERVAL = 15
+DEFAULT_MAX_INTERVAL = 300
+DEFAULT_FLEET_RETRIES = 2
+ENERGY_GAP_FACTOR = 1.5  # longest poll span counted by the energy estimate, in max intervals
+RESOLVE_INTERVAL = 600  # seconds between attempts to find an unreachable thermostat at a new address
+
+
+class AdaptivePollInterval:
+    """Pick the delay until the next poll of one thermostat from its telemetry.
+
+    The device is polled every ``min_interval`` seconds while it is heating,
+    while the floor is far from the current setting or shortly after a write.
+    Once it is idle and stable the interval doubles up to ``max_interval``.
+    """
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 setting_gap=1.0, write_hold=120):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.setting_gap = setting_gap
+        self.write_hold = write_hold
+        self.interval = min_interval
+
+    def _active(self, client: AsyncTerneoAX) -> bool:
+        if time() - client.last_write < self.write_hold:
+            return True
+        if client._telemetry_value('loadCondition') == 1:
+            return True
+        floor = client._telemetry_value('floorSensor')
+        setting = client._telemetry_value('currentSetting')
+        if floor is None or setting is None:
+            return True
+        return abs(floor - setting) > self.setting_gap
+
+    def next_interval(self, client: AsyncTerneoAX) -> float:
+        if not client.last_update_success or self._active(client):
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return self.interval
+
+
+class TerneoAXCoordinator:
+    """Own every AsyncTerneoAX client on the host and poll them together.
+
+    Clients are refreshed concurrently, at most ``max_concurrency`` at a time,
+    each one when its own AdaptivePollInterval says it is due.  The listeners
+    registered for a client are called after a refresh that changed its data
+    so entities can write their state from it.
+
+    Clients are known by the address they were configured with.  When a
+    client's circuit breaker opens, the optional ``resolver`` coroutine is
+    asked for the device's current address, so a thermostat moved by DHCP is
+    picked up again.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, resolver=None):
+        self._clients = {}
+        self._listeners = {}
+        self._refresh_listeners = {}
+        self._intervals = {}
+        self._next_poll = {}
+        self._last_resolve = {}
+        self._resolving = {}
+        self._refreshes = {}
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.resolver = resolver
+
+    @property
+    def clients(self):
+        return list(self._clients.values())
+
+    def get_client(self, addr):
+        return self._clients.get(addr)
+
+    def add_client(self, client: AsyncTerneoAX, min_interval=DEFAULT_MIN_INTERVAL,
+                   max_interval=DEFAULT_MAX_INTERVAL) -> AsyncTerneoAX:
+        """Register a client, returning the already known one for the same address."""
+        if client.addr not in self._clients:
+            self._clients[client.addr] = client
+            self._intervals[client] = AdaptivePollInterval(min_interval, max_interval)
+            # an idle thermostat is polled every max_interval, that span is not a missed poll
+            client.energy.max_gap = max(client.energy.max_gap, max_interval * ENERGY_GAP_FACTOR)
+        return self._clients[client.addr]
+
+    def async_add_listener(self, client: AsyncTerneoAX, update_callback: Callable[[], None], every_refresh=False):
+        """Call update_callback after refreshes of client that changed its data; returns the remover.
+
+        With ``every_refresh`` it is called after every refresh attempt, failed
+        or skipped by the breaker ones included.
+        """
+        listeners = (self._refresh_listeners if every_refresh else self._listeners).setdefault(client, [])
+        listeners.append(update_callback)
+
+        def remove_listener():
+            listeners.remove(update_callback)
+
+        return remove_listener
+
+    def _notify(self, client: AsyncTerneoAX):
+        for update_callback in list(self._listeners.get(client, [])):
+            update_callback()
+
+    async def async_refresh_client(self, client: AsyncTerneoAX) -> bool:
+        """Refresh client, joining its refresh that is already running instead of starting another."""
+        # a cancelled caller must not cancel the refresh the others wait for
+        return await asyncio.shield(self._refresh_task(client))
+
+    def _refresh_task(self, client: AsyncTerneoAX) -> asyncio.Task:
+        task = self._refreshes.get(client)
+        if task is None:
+            task = self._refreshes[client] = asyncio.ensure_future(self._async_refresh_client(client))
+            task.add_done_callback(lambda _task: self._refresh_finished(client, _task))
+        return task
+
+    def _refresh_finished(self, client: AsyncTerneoAX, task: asyncio.Task):
+        self._refreshes.pop(client, None)
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.error("{} refresh failed".format(client.addr), exc_info=task.exception())
+
+    async def _async_refresh_client(self, client: AsyncTerneoAX) -> bool:
+        async with self._semaphore:
+            success = await client.refresh()
+        interval = self._intervals[client].next_interval(client)
+        self._next_poll[client] = time() + interval
+        if client.changed:
+            self._notify(client)
+        for update_callback in list(self._refresh_listeners.get(client, [])):
+            update_callback()
+        if client.breaker.state == CircuitBreaker.OPEN and self._resolve_due(client):
+            task = self._resolving[client] = asyncio.ensure_future(self._async_resolve(client))
+            task.add_done_callback(lambda _task: self._resolving.pop(client, None))
+        return success
+
+    def _resolve_due(self, client: AsyncTerneoAX) -> bool:
+        if self.resolver is None or client._sn is None or client in self._resolving:
+            return False
+        return time() - self._last_resolve.get(client, 0) > RESOLVE_INTERVAL
+
+    async def _async_resolve(self, client: AsyncTerneoAX):
+        self._last_resolve[client] = time()
+        try:
+            addr = await self.resolver(client)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("{} [{}] failed to look up the new address".format(client.addr, client._sn))
+            return
+        if addr is None or addr == client.addr:
+            return
+        _LOGGER.warning("{} [{}] moved to {}".format(client.addr, client._sn, addr))
+        client.addr = addr
+        client.breaker.reset()
+        await self.async_refresh_client(client)
+
+    def due_clients(self, now=None):
+        now = time() if now is None else now
+        return [client for client in self.clients
+                if self._next_poll.get(client, 0) <= now and client not in self._refreshes]
+
+    async def async_refresh(self, _now=None):
+        """Start a refresh of every client that is due, without waiting for them.
+
+        Each refresh runs on its own, so a slow device does not hold back the
+        ticks of the others; a client still being refreshed is not due.
+        """
+        for client in self.due_clients():
+            self._refresh_task(client)
+
+    async def async_apply(self, change: Callable[[AsyncTerneoAX], bool], addrs=None,
+                          retries=DEFAULT_FLEET_RETRIES, max_parallel=None) -> dict:
+        """Apply one change to many clients and write it, returning the success of each address.
+
+        ``change`` sets params on a client, as client.set_away does, and
+        returns False if it could not.  The writes bypass the debounce of
+        queue_write and run at most ``max_parallel`` at a time; the devices
+        that failed are tried again up to ``retries`` times.  ``addrs``
+        selects clients by their configured address, all clients by default.
+        """
+        if addrs is None:
+            addrs = list(self._clients)
+        results = {addr: False for addr in addrs}
+        pending = {addr: self._clients[addr] for addr in addrs if addr in self._clients}
+        semaphore = asyncio.Semaphore(max_parallel or self.max_concurrency)
+        for attempt in range(retries + 1):
+            if attempt:
+                _LOGGER.info("Retrying fleet change on {}".format(", ".join(pending)))
+            outcomes = await asyncio.gather(*(
+                self._async_apply_client(client, change, semaphore) for client in pending.values()
+            ))
+            for addr, success in zip(list(pending), outcomes):
+                results[addr] = success
+                if success:
+                    del pending[addr]
+            if not pending:
+                break
+        return results
+
+    async def _async_apply_client(self, client: AsyncTerneoAX, change, semaphore) -> bool:
+        async with semaphore:
+            # params must be known to change them, a client that never answered is read first
+            if client._params is None:
+                await self.async_refresh_client(client)
+                if client._params is None:
+                    return False
+            if not change(client):
+                return False
+            if len(client._changed_params()):
+                success = await client.send_changed_params()
+            else:
+                success = True
+        if success:
+            self._notify(client)
+        return success
@@ -0,0 +1,104 @@
+"""Finding TerneoAX thermostats on the LAN."""
+import asyncio
+import ipaddress
+import logging
+
+import aiohttp
+
+from .terneo_api import async_probe, create_session
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SCAN_CONCURRENCY = 64
+DEFAULT_PROBE_TIMEOUT = 2
+
+
+def _scan_session(concurrency) -> aiohttp.ClientSession:
+    # a sweep gets connections of its own: probes must not queue behind the
+    # pollers' pool, nor take its slots while most addresses hang
+    return create_session(limit=concurrency, limit_per_host=1)
+
+
+async def async_scan_network(network, concurrency=DEFAULT_SCAN_CONCURRENCY, timeout=DEFAULT_PROBE_TIMEOUT) -> dict:
+    """Probe every host of network concurrently; returns {addr: serial number} of the thermostats found."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with _scan_session(concurrency) as session:
+        async def _probe(addr):
+            async with semaphore:
+                return addr, await async_probe(session, addr, timeout)
+
+        hosts = [str(addr) for addr in ipaddress.ip_network(network, strict=False).hosts()]
+        results = await asyncio.gather(*(_probe(addr) for addr in hosts))
+    found = {addr: sn for addr, sn in results if sn is not None}
+    _LOGGER.info("Found {} TerneoAX thermostats in {}".format(len(found), network))
+    return found
+
+
+async def async_find_serial(network, sn, concurrency=DEFAULT_SCAN_CONCURRENCY, timeout=DEFAULT_PROBE_TIMEOUT):
+    """Sweep network for the thermostat with serial number sn, stopping at the first match."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with _scan_session(concurrency) as session:
+        async def _probe(addr):
+            async with semaphore:
+                return addr, await async_probe(session, addr, timeout)
+
+        tasks = [asyncio.ensure_future(_probe(str(addr)))
+                 for addr in ipaddress.ip_network(network, strict=False).hosts()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                addr, found = await next_done
+                if found == sn:
+                    return addr
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return None
+
+
+class TerneoAddressBook:
+    """Serial number to address map of known thermostats.
+
+    Addresses are learned from successful polls.  ``async_resolve`` looks for
+    one unreachable thermostat by its serial number, first in the networks
+    configured for scanning, then in the /24 around its last address.
+    """
+
+    def __init__(self, addresses=None):
+        self.addresses = dict(addresses or {})
+        self.networks = set()
+
+    def lookup(self, sn):
+        return self.addresses.get(sn)
+
+    def learn(self, sn, addr) -> bool:
+        """Remember where sn answered; True if that is new."""
+        if sn is None or self.addresses.get(sn) == addr:
+            return False
+        self.addresses[sn] = addr
+        return True
+
+    def _networks_for(self, addr):
+        networks = list(self.networks)
+        try:
+            own = str(ipaddress.ip_network("{}/24".format(addr), strict=False))
+        except ValueError:
+            return networks
+        if own not in networks:
+            networks.append(own)
+        return networks
+
+    async def async_resolve(self, client):
+        """Current address of client's thermostat, None if it was not found.
+
+        The address is not learned here: that happens, and is saved, once a
+        poll at the new address succeeds.
+        """
+        for network in self._networks_for(client.addr):
+            addr = await async_find_serial(network, client._sn)
+            if addr is not None:
+                return addr
+        _LOGGER.debug("{} [{}] not found on {}".format(client.addr, client._sn, self._networks_for(client.addr)))
+        return None
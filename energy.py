@@ -0,0 +1,58 @@
+"""Streaming heating energy estimate of a TerneoAX thermostat."""
+
+DEFAULT_MAX_GAP = 900
+
+
+def decode_power(power):
+    """Connected load in watts from the ``power`` parameter, P=(power<=150)?(power*10):(1500+power*20)."""
+    if power is None:
+        return None
+    return power * 10 if power <= 150 else 1500 + power * 20
+
+
+class EnergyEstimator:
+    """Integrate load on-time times connected power between polls.
+
+    The load state seen at a poll is assumed to hold until the next poll.
+    Spans longer than ``max_gap`` seconds (missed polls, an unreachable
+    device, a restart) are not counted, since what happened in them is
+    unknown.  Only running totals are kept, so memory is constant.
+    """
+
+    def __init__(self, max_gap=DEFAULT_MAX_GAP):
+        self.max_gap = max_gap
+        self.energy_wh = 0.0
+        self.on_time = 0.0
+        self.total_time = 0.0
+        self._last_ts = None
+        self._last_on = False
+        self._last_power = None
+
+    def update(self, ts, load_on, power_w):
+        if self._last_ts is not None:
+            span = ts - self._last_ts
+            if 0 < span <= self.max_gap:
+                self.total_time += span
+                if self._last_on:
+                    self.on_time += span
+                    if self._last_power is not None:
+                        self.energy_wh += self._last_power * span / 3600
+        self._last_ts = ts
+        self._last_on = bool(load_on)
+        self._last_power = power_w
+
+    def restore(self, energy_kwh, on_time=0.0, total_time=0.0):
+        """Continue from previously saved totals, keeping what was counted since."""
+        self.energy_wh += energy_kwh * 1000
+        self.on_time += on_time
+        self.total_time += total_time
+
+    @property
+    def energy_kwh(self):
+        return self.energy_wh / 1000
+
+    @property
+    def duty_cycle(self):
+        if not self.total_time:
+            return None
+        return self.on_time / self.total_time
@@ -0,0 +1,67 @@
+"""Base entity for TerneoAX thermostats."""
+from homeassistant.core import callback
+from homeassistant.helpers.entity import Entity
+
+from .coordinator import TerneoAXCoordinator
+from .terneo_api import AsyncTerneoAX
+
+
+class TerneoAXEntity(Entity):
+    """Entity fed by the coordinator from the shared client of one thermostat.
+
+    Entities are added without an update, their values arrive with the
+    background refresh of the shared client.  The state is written only when
+    ``_published_value`` differs from the one last written.
+    """
+
+    # listen to every refresh attempt, not only to the ones that changed the data
+    _every_refresh = False
+
+    def __init__(self, client: AsyncTerneoAX, coordinator: TerneoAXCoordinator):
+        """Initialize the entity."""
+        self._client = client
+        self._coordinator = coordinator
+        self._remove_listener = None
+        self._published = None
+
+    @property
+    def should_poll(self):
+        """Polling is done by the coordinator for the whole fleet."""
+        return False
+
+    @property
+    def available(self):
+        """Return True if the last refresh succeeded, or restored state is shown until the first refresh."""
+        return self._client.last_update_success or self._client.stale
+
+    async def async_added_to_hass(self):
+        """Subscribe to coordinator refreshes of the thermostat."""
+        self._remove_listener = self._coordinator.async_add_listener(
+            self._client, self._handle_update, every_refresh=self._every_refresh
+        )
+
+    async def async_will_remove_from_hass(self):
+        """Stop listening to the coordinator."""
+        if self._remove_listener is not None:
+            self._remove_listener()
+            self._remove_listener = None
+
+    async def async_update(self):
+        """Refresh the thermostat through the coordinator."""
+        await self._coordinator.async_refresh_client(self._client)
+
+    def _published_value(self):
+        """Return what the written state depends on."""
+        return self.available, self.state
+
+    @callback
+    def _handle_update(self):
+        """Write the state fetched by the coordinator, if it changed."""
+        if self._published_value() != self._published:
+            self._publish()
+
+    @callback
+    def _publish(self):
+        """Write the current state to the state machine."""
+        self._published = self._published_value()
+        self.async_write_ha_state()
@@ -0,0 +1,156 @@
+"""Bounded in-memory telemetry history of a TerneoAX thermostat."""
+from array import array
+from collections import namedtuple
+from math import inf
+
+TelemetryAggregate = namedtuple('TelemetryAggregate', ['count', 'mean', 'min', 'max'])
+
+DEFAULT_FIELDS = ('floorSensor', 'airSensor', 'loadCondition', 'averageLoadPower')
+
+RESOLUTION_RAW = 0
+RESOLUTION_MINUTE = 60
+RESOLUTION_QUARTER = 900
+
+# bucket width in seconds: number of buckets kept
+DEFAULT_RESOLUTIONS = {
+    RESOLUTION_RAW: 360,  # last samples as polled
+    RESOLUTION_MINUTE: 360,  # 6 hours
+    RESOLUTION_QUARTER: 384,  # 4 days
+}
+
+
+class _Ring:
+    """Fixed-size ring of time buckets holding sum/min/max/count per field."""
+
+    __slots__ = ('width', 'size', 'fields', 'times', 'sums', 'mins', 'maxs', 'counts', 'head', 'length')
+
+    def __init__(self, width, size, fields):
+        self.width = width
+        self.size = size
+        self.fields = fields
+        self.times = array('d', bytes(8 * size))
+        self.sums = array('d', bytes(8 * size * fields))
+        self.mins = array('d', bytes(8 * size * fields))
+        self.maxs = array('d', bytes(8 * size * fields))
+        self.counts = array('L', bytes(array('L').itemsize * size * fields))
+        self.head = 0
+        self.length = 0
+
+    def _open(self, start):
+        self.head = (self.head + 1) % self.size if self.length else 0
+        self.length = min(self.length + 1, self.size)
+        self.times[self.head] = start
+        base = self.head * self.fields
+        for i in range(base, base + self.fields):
+            self.sums[i] = 0.0
+            self.mins[i] = inf
+            self.maxs[i] = -inf
+            self.counts[i] = 0
+
+    def add(self, ts, values):
+        start = ts if self.width == 0 else ts - ts % self.width
+        if self.width == 0 or not self.length or start > self.times[self.head]:
+            self._open(start)
+        base = self.head * self.fields
+        for offset, value in enumerate(values):
+            if value is None:
+                continue
+            i = base + offset
+            self.sums[i] += value
+            self.counts[i] += 1
+            if value < self.mins[i]:
+                self.mins[i] = value
+            if value > self.maxs[i]:
+                self.maxs[i] = value
+
+    def slots(self, since):
+        """Yield ring indexes of the buckets ending after since, newest first.
+
+        The bucket that starts before since is included whole, as its samples
+        are not kept apart.
+        """
+        for n in range(self.length):
+            slot = (self.head - n) % self.size
+            start = self.times[slot]
+            if start < since and start + self.width <= since:
+                break
+            yield slot
+
+    @property
+    def wrapped(self):
+        return self.length == self.size
+
+    @property
+    def oldest(self):
+        if not self.length:
+            return None
+        return self.times[(self.head - self.length + 1) % self.size]
+
+
+class TelemetryHistory:
+    """Ring buffers of selected telemetry fields at several resolutions.
+
+    Every recorded sample goes into the raw ring and is folded into the
+    1-minute and 15-minute buckets, so memory stays fixed per device while
+    aggregates over hours or days remain available without the recorder.
+    """
+
+    def __init__(self, fields=DEFAULT_FIELDS, resolutions=None):
+        self.fields = tuple(fields)
+        self._index = {field: i for i, field in enumerate(self.fields)}
+        resolutions = DEFAULT_RESOLUTIONS if resolutions is None else resolutions
+        self._rings = {width: _Ring(width, size, len(self.fields)) for width, size in sorted(resolutions.items())}
+
+    def record(self, ts, telemetry):
+        values = [telemetry.get(field) for field in self.fields]
+        for ring in self._rings.values():
+            ring.add(ts, values)
+
+    def _ring_for(self, since):
+        """Finest ring that still covers since.
+
+        A window longer than the history is served by the finest ring that
+        still holds every sample, and only once all of them wrapped by the
+        coarsest one.
+        """
+        for ring in self._rings.values():
+            if ring.oldest is not None and ring.oldest <= since:
+                return ring
+        ring = None
+        for ring in self._rings.values():
+            if not ring.wrapped:
+                return ring
+        return ring
+
+    def aggregate(self, field, window, now, resolution=None) -> TelemetryAggregate:
+        """Count, mean, min and max of field over the last window seconds."""
+        offset = self._index[field]
+        since = now - window
+        ring = self._rings[resolution] if resolution is not None else self._ring_for(since)
+        total = 0.0
+        count = 0
+        low = inf
+        high = -inf
+        for slot in ring.slots(since):
+            i = slot * ring.fields + offset
+            if not ring.counts[i]:
+                continue
+            total += ring.sums[i]
+            count += ring.counts[i]
+            low = min(low, ring.mins[i])
+            high = max(high, ring.maxs[i])
+        if not count:
+            return TelemetryAggregate(0, None, None, None)
+        return TelemetryAggregate(count, total / count, low, high)
+
+    def series(self, field, resolution, window, now):
+        """List of (bucket start, mean) of field over the last window seconds, oldest first."""
+        offset = self._index[field]
+        ring = self._rings[resolution]
+        points = []
+        for slot in ring.slots(now - window):
+            i = slot * ring.fields + offset
+            if ring.counts[i]:
+                points.append((ring.times[slot], ring.sums[i] / ring.counts[i]))
+        points.reverse()
+        return points
@@ -0,0 +1,177 @@
+"""Per-device request counters and latency histograms of a TerneoAX client."""
+from bisect import bisect_left
+
+# upper bounds of the latency buckets in seconds, the last bucket is unbounded
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+COMMAND_PARAMS = "cmd:1"
+COMMAND_SCHEDULE = "cmd:2"
+COMMAND_TELEMETRY = "cmd:4"
+COMMAND_WRITE = "write"
+
+ERROR_TIMEOUT = "timeout"
+ERROR_CONNECTION = "connection"
+ERROR_HTTP = "http"
+
+
+def command_of(data):
+    """Metrics key of a request payload."""
+    if data is None:
+        return "get"
+    if "par" in data:
+        return COMMAND_WRITE
+    return "cmd:{}".format(data.get("cmd"))
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram.
+
+    Percentiles are reported as the upper bound of the bucket they fall in;
+    values past the last bound are reported as that bound.
+    """
+
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, pct):
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS[min(index, len(LATENCY_BUCKETS) - 1)]
+        return None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": _ms(self.mean),
+            "p50_ms": _ms(self.percentile(50)),
+            "p99_ms": _ms(self.percentile(99)),
+            "buckets": list(self.counts),
+        }
+
+
+class CommandMetrics:
+    """Counters of one command type.
+
+    ``wait`` is the time until the response headers arrived, which includes
+    connecting, sending the request and the device preparing the answer;
+    ``read`` is the time spent receiving the body.  Neither HTTP client
+    exposes the bare connect time without tracing every request, so this
+    split is what is kept.
+    """
+
+    __slots__ = ('requests', 'errors', 'bytes_sent', 'bytes_received', 'wait', 'read', 'total')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.wait = LatencyHistogram()
+        self.read = LatencyHistogram()
+        self.total = LatencyHistogram()
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "wait": self.wait.as_dict(),
+            "read": self.read.as_dict(),
+            "total": self.total.as_dict(),
+        }
+
+
+class RequestMetrics:
+    """Request metrics of one device, keyed by command type."""
+
+    def __init__(self):
+        self.commands = {}
+        self.decode = LatencyHistogram()
+        self.decode_errors = 0
+
+    def _command(self, command) -> CommandMetrics:
+        metrics = self.commands.get(command)
+        if metrics is None:
+            metrics = self.commands[command] = CommandMetrics()
+        return metrics
+
+    def record(self, command, sent, wait, read=None, received=0, error=None):
+        """Count one request; ``read`` is None when no body was received."""
+        metrics = self._command(command)
+        metrics.requests += 1
+        metrics.bytes_sent += sent
+        metrics.bytes_received += received
+        metrics.wait.observe(wait)
+        if read is not None:
+            metrics.read.observe(read)
+        metrics.total.observe(wait + (read or 0))
+        if error is not None:
+            metrics.errors[error] = metrics.errors.get(error, 0) + 1
+
+    def record_decode(self, seconds, ok=True):
+        self.decode.observe(seconds)
+        if not ok:
+            self.decode_errors += 1
+
+    @property
+    def requests(self):
+        return sum(metrics.requests for metrics in self.commands.values())
+
+    @property
+    def errors(self):
+        return sum(sum(metrics.errors.values()) for metrics in self.commands.values())
+
+    @property
+    def mean_latency(self):
+        count = sum(metrics.total.count for metrics in self.commands.values())
+        if not count:
+            return None
+        return sum(metrics.total.total for metrics in self.commands.values()) / count
+
+    def reset(self):
+        self.commands = {}
+        self.decode = LatencyHistogram()
+        self.decode_errors = 0
+
+    def summary(self):
+        """Request and error counts with mean and p99 latency per command, without the histograms."""
+        return {
+            command: {
+                "requests": metrics.requests,
+                "errors": sum(metrics.errors.values()),
+                "mean_ms": _ms(metrics.total.mean),
+                "p99_ms": _ms(metrics.total.percentile(99)),
+            }
+            for command, metrics in self.commands.items()
+        }
+
+    def as_dict(self):
+        return {
+            "buckets_ms": [round(bound * 1000) for bound in LATENCY_BUCKETS],
+            "commands": {command: metrics.as_dict() for command, metrics in self.commands.items()},
+            "decode": self.decode.as_dict(),
+            "decode_errors": self.decode_errors,
+        }
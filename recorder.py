@@ -0,0 +1,162 @@
+"""Record raw TerneoAX traffic to a file and replay it without devices."""
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from .metrics import ERROR_HTTP, command_of
+from .terneo_api import AsyncTerneoAX, TerneoAX
+
+# one JSON object per line:
+#   t: request start (unix time), a: device address, q: request payload,
+#   d: seconds until the response, r: raw response body (latin-1, so any bytes survive), e: error class
+FIELD_TIME = "t"
+FIELD_ADDR = "a"
+FIELD_REQUEST = "q"
+FIELD_ELAPSED = "d"
+FIELD_RESPONSE = "r"
+FIELD_ERROR = "e"
+
+
+class TrafficRecorder:
+    """Append every request and response of the clients using it to a JSON-lines file.
+
+    Lines are written by a background thread, so recording does not block the
+    event loop or the polling threads.  Assign to ``client.recorder`` to start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="terneoax-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, addr, data, body, elapsed, error=None, start=None):
+        entry = {
+            FIELD_TIME: round(start if start is not None else time.time() - elapsed, 3),
+            FIELD_ADDR: addr,
+            FIELD_REQUEST: data,
+            FIELD_ELAPSED: round(elapsed, 4),
+        }
+        if body is not None:
+            entry[FIELD_RESPONSE] = body.decode("latin-1")
+        if error is not None:
+            entry[FIELD_ERROR] = error
+        self._queue.put(json.dumps(entry, separators=(",", ":")))
+
+    def _write(self):
+        with open(self.path, "a", encoding="ascii") as file:
+            while True:
+                line = self._queue.get()
+                if line is None:
+                    return
+                file.write(line + "\n")
+                if self._queue.empty():
+                    file.flush()
+
+    def close(self):
+        """Write the queued lines and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class ReplayTransport:
+    """Responses of a recording, handed out per device and command in recorded order.
+
+    With ``speed`` set, each response is held back until its place on the
+    recorded timeline, ``speed`` times faster than it was recorded; with
+    ``speed=None`` responses are returned at once.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        self._entries = {}
+        self._start = None
+        self._clock = None
+        with open(path, encoding="ascii") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if self._start is None or entry[FIELD_TIME] < self._start:
+                    self._start = entry[FIELD_TIME]
+                key = (entry[FIELD_ADDR], command_of(entry[FIELD_REQUEST]))
+                self._entries.setdefault(key, []).append(entry)
+        for entries in self._entries.values():
+            entries.reverse()
+
+    @property
+    def addresses(self):
+        return sorted({addr for addr, _ in self._entries})
+
+    def next(self, addr, data):
+        """Return the next recorded entry of this request, or None when the recording is exhausted."""
+        entries = self._entries.get((addr, command_of(data)))
+        if not entries:
+            return None
+        return entries.pop()
+
+    def delay(self, entry):
+        """Seconds to wait before answering with entry."""
+        if self.speed is None:
+            return 0
+        now = time.monotonic()
+        if self._clock is None:
+            self._clock = now
+        due = (entry[FIELD_TIME] + entry[FIELD_ELAPSED] - self._start) / self.speed
+        return max(0.0, due - (now - self._clock))
+
+    @staticmethod
+    def response(entry):
+        """Body of a recorded success, or None for a recorded failure."""
+        if FIELD_ERROR in entry or FIELD_RESPONSE not in entry:
+            return None
+        return entry[FIELD_RESPONSE].encode("latin-1")
+
+
+class ReplayTerneoAX(TerneoAX):
+    """TerneoAX answered from a recording instead of the device."""
+
+    def __init__(self, addr, transport: ReplayTransport, **kwargs):
+        super().__init__(addr, **kwargs)
+        self.transport = transport
+
+    def _request(self, path, data=None):
+        entry = self.transport.next(self.addr, data)
+        if entry is None:
+            self._request_failed("{} recording exhausted for {}".format(self.addr, command_of(data)))
+            return False
+        time.sleep(self.transport.delay(entry))
+        return _replayed(self, data, entry)
+
+
+class AsyncReplayTerneoAX(AsyncTerneoAX):
+    """AsyncTerneoAX answered from a recording instead of the device."""
+
+    def __init__(self, addr, transport: ReplayTransport, **kwargs):
+        super().__init__(addr, **kwargs)
+        self.transport = transport
+
+    async def _send(self, path, data=None):
+        entry = self.transport.next(self.addr, data)
+        if entry is None:
+            self._request_failed("{} recording exhausted for {}".format(self.addr, command_of(data)))
+            return False
+        await asyncio.sleep(self.transport.delay(entry))
+        return _replayed(self, data, entry)
+
+
+def _replayed(client, data, entry):
+    body = ReplayTransport.response(entry)
+    command = command_of(data)
+    sent = len(json.dumps(data)) if data is not None else 0
+    if body is None:
+        client._observe(data, command, sent, entry[FIELD_ELAPSED], error=entry.get(FIELD_ERROR, ERROR_HTTP))
+        client._request_failed("{} recorded {} failure".format(client.addr, entry.get(FIELD_ERROR, ERROR_HTTP)))
+        return False
+    client._observe(data, command, sent, entry[FIELD_ELAPSED], 0, body)
+    client._request_ok()
+    return body
@@ -0,0 +1,69 @@
+"""Local evaluation of the TerneoAX weekly schedule."""
+import datetime
+from collections import namedtuple
+
+SCHEDULE_TEMP_DIVIDER = 10  # schedule setpoints are sent in 1/10 °C
+MINUTES_PER_DAY = 24 * 60
+
+SchedulePeriod = namedtuple('SchedulePeriod', ['day', 'index', 'minute', 'temperature'])
+
+
+class TerneoSchedule:
+    """Weekly schedule from the ``tt`` field of a cmd:2 response.
+
+    ``tt`` maps the weekday (Monday = "0") to a list of [minute of day,
+    setpoint] periods.  A period lasts until the next one starts, wrapping
+    over midnight and the end of the week.
+    """
+
+    def __init__(self, tt):
+        self.tt = tt
+        self.periods = []
+        for day in range(7):
+            for index, (minute, temperature) in enumerate(sorted(tt.get(str(day), []))):
+                self.periods.append(SchedulePeriod(day, index, int(minute),
+                                                   int(temperature) / SCHEDULE_TEMP_DIVIDER))
+
+    def __bool__(self):
+        return bool(self.periods)
+
+    @staticmethod
+    def _week_minute(moment: datetime.datetime):
+        return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+    def _position(self, week_minute):
+        """Index in periods of the period active at week_minute."""
+        active = len(self.periods) - 1  # before the first period of the week the last one still runs
+        for i, period in enumerate(self.periods):
+            if period.day * MINUTES_PER_DAY + period.minute > week_minute:
+                break
+            active = i
+        return active
+
+    def active_period(self, moment: datetime.datetime):
+        if not self.periods:
+            return None
+        return self.periods[self._position(self._week_minute(moment))]
+
+    def setpoint_at(self, moment: datetime.datetime):
+        period = self.active_period(moment)
+        return period.temperature if period is not None else None
+
+    def next_transition(self, moment: datetime.datetime):
+        """(time, setpoint) of the next period start after moment, or None."""
+        if not self.periods:
+            return None
+        week_minute = self._week_minute(moment)
+        period = self.periods[(self._position(week_minute) + 1) % len(self.periods)]
+        delta = (period.day * MINUTES_PER_DAY + period.minute - week_minute) % (7 * MINUTES_PER_DAY)
+        if delta == 0:
+            delta = 7 * MINUTES_PER_DAY
+        start = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=delta)
+        return start, period.temperature
+
+    def period_number(self, moment: datetime.datetime, max_periods):
+        """Active period in the numbering of the numberPeriodOfSchedule telemetry."""
+        period = self.active_period(moment)
+        if period is None or not max_periods:
+            return None
+        return period.day * max_periods + period.index
@@ -0,0 +1,102 @@
+"""Request scheduling for TerneoAX thermostats."""
+import asyncio
+import heapq
+import itertools
+import json
+
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+class RequestLimiter:
+    """Cap on requests in flight across all devices, handing free slots to writes first."""
+
+    def __init__(self, limit=DEFAULT_MAX_IN_FLIGHT):
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority=PRIORITY_READ):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just before the cancellation
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # the slot passes straight to the waiter
+                return
+        self.active -= 1
+
+
+_default_limiter = None
+
+
+def default_limiter() -> RequestLimiter:
+    """Limiter shared by the clients that were not given one."""
+    global _default_limiter
+    if _default_limiter is None:
+        _default_limiter = RequestLimiter()
+    return _default_limiter
+
+
+class DeviceRequestQueue:
+    """Run the requests of one device one at a time.
+
+    Pending writes go before pending reads, and a read identical to one that
+    is already waiting shares its result instead of being sent again.
+    """
+
+    def __init__(self, limiter: RequestLimiter):
+        self._limiter = limiter
+        self._pending = []
+        self._reads = {}
+        self._seq = itertools.count()
+        self._worker = None
+
+    async def submit(self, send, path, data=None, write=False):
+        """Queue send(path, data) and return its result."""
+        key = None
+        if not write:
+            key = (path, json.dumps(data, sort_keys=True))
+            if key in self._reads:
+                return await asyncio.shield(self._reads[key])
+        future = asyncio.get_running_loop().create_future()
+        priority = PRIORITY_WRITE if write else PRIORITY_READ
+        heapq.heappush(self._pending, (priority, next(self._seq), key, send, path, data, future))
+        if key is not None:
+            self._reads[key] = future
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._run())
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        try:
+            while self._pending:
+                priority, _, key, send, path, data, future = heapq.heappop(self._pending)
+                if key is not None:
+                    self._reads.pop(key, None)
+                await self._limiter.acquire(priority)
+                try:
+                    result = await send(path, data)
+                except Exception as ex:  # pylint: disable=broad-except
+                    future.set_exception(ex)
+                else:
+                    future.set_result(result)
+                finally:
+                    self._limiter.release()
+        finally:
+            self._worker = None
@@ -0,0 +1,214 @@
+"""Telemetry sensors of TerneoAX thermostats."""
+import voluptuous as vol
+
+from homeassistant.components.sensor import PLATFORM_SCHEMA, STATE_CLASS_TOTAL_INCREASING, SensorEntity
+from homeassistant.const import (
+    CONF_MONITORED_CONDITIONS,
+    DEVICE_CLASS_ENERGY,
+    DEVICE_CLASS_POWER,
+    DEVICE_CLASS_SIGNAL_STRENGTH,
+    DEVICE_CLASS_TEMPERATURE,
+    ELECTRICAL_CURRENT_AMPERE,
+    ENERGY_KILO_WATT_HOUR,
+    POWER_WATT,
+    SIGNAL_STRENGTH_DECIBELS_MILLIWATT,
+    TEMP_CELSIUS,
+    TIME_MILLISECONDS,
+    VOLT,
+)
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.restore_state import RestoreEntity
+
+from . import DEVICE_SCHEMA_FIELDS, async_get_clients, async_get_coordinator, device_platform_schema
+from .coordinator import TerneoAXCoordinator
+from .entity import TerneoAXEntity
+from .terneo_api import AsyncTerneoAX
+
+# telemetry field: (name suffix, unit, device class, icon)
+SENSOR_TYPES = {
+    "floorSensor": ("floor temperature", TEMP_CELSIUS, DEVICE_CLASS_TEMPERATURE, None),
+    "airSensor": ("air temperature", TEMP_CELSIUS, DEVICE_CLASS_TEMPERATURE, None),
+    "currentSetting": ("current setting", TEMP_CELSIUS, DEVICE_CLASS_TEMPERATURE, None),
+    "supplyVoltage": ("voltage", VOLT, None, "mdi:flash"),
+    "averageCurrent": ("current", ELECTRICAL_CURRENT_AMPERE, None, "mdi:current-ac"),
+    "averageLoadPower": ("power", POWER_WATT, DEVICE_CLASS_POWER, None),
+    "avgCosinePhi": ("power factor", None, None, "mdi:angle-acute"),
+    "wifiSignalLevel": ("wifi signal", SIGNAL_STRENGTH_DECIBELS_MILLIWATT, DEVICE_CLASS_SIGNAL_STRENGTH, None),
+}
+
+# estimated from loadCondition and the connected power parameter
+SENSOR_ENERGY = "energy"
+# request metrics of the client, not enabled by default
+SENSOR_REQUESTS = "requests"
+
+ATTR_DUTY_CYCLE = "duty_cycle"
+ATTR_ON_TIME = "on_time"
+ATTR_TOTAL_TIME = "total_time"
+ATTR_REQUESTS = "requests"
+ATTR_ERRORS = "errors"
+
+PLATFORM_SCHEMA = device_platform_schema(PLATFORM_SCHEMA.extend(
+    {
+        **DEVICE_SCHEMA_FIELDS,
+        vol.Optional(CONF_MONITORED_CONDITIONS, default=[*SENSOR_TYPES, SENSOR_ENERGY]): vol.All(
+            cv.ensure_list, [vol.In([*SENSOR_TYPES, SENSOR_ENERGY, SENSOR_REQUESTS])]
+        ),
+    }
+))
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the TerneoAX telemetry sensors."""
+
+    coordinator = async_get_coordinator(hass)
+    clients = await async_get_clients(hass, config)
+
+    entities = []
+    for client in clients:
+        for field in config[CONF_MONITORED_CONDITIONS]:
+            if field == SENSOR_ENERGY:
+                entities.append(TerneoAXEnergySensor(client, coordinator))
+            elif field == SENSOR_REQUESTS:
+                entities.append(TerneoAXRequestsSensor(client, coordinator))
+            else:
+                entities.append(TerneoAXTelemetrySensor(client, coordinator, field))
+    async_add_entities(entities)
+
+
+class TerneoAXTelemetrySensor(TerneoAXEntity, SensorEntity):
+    """One telemetry field of a thermostat, read from the shared cmd:4 response."""
+
+    def __init__(self, client: AsyncTerneoAX, coordinator: TerneoAXCoordinator, field):
+        """Initialize the sensor."""
+        super().__init__(client, coordinator)
+        self._field = field
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return "{} {}".format(self._client.name, SENSOR_TYPES[self._field][0])
+
+    @property
+    def state(self):
+        """Return the decoded telemetry value."""
+        return self._client._telemetry_value(self._field)
+
+    @property
+    def unit_of_measurement(self):
+        """Return the unit of the telemetry value."""
+        return SENSOR_TYPES[self._field][1]
+
+    @property
+    def device_class(self):
+        """Return the device class of the sensor."""
+        return SENSOR_TYPES[self._field][2]
+
+    @property
+    def icon(self):
+        """Return the icon of the sensor."""
+        return SENSOR_TYPES[self._field][3]
+
+
+class TerneoAXEnergySensor(TerneoAXEntity, SensorEntity, RestoreEntity):
+    """Heating energy of a thermostat estimated by the client's EnergyEstimator."""
+
+    async def async_added_to_hass(self):
+        """Continue the totals saved before the restart."""
+        await super().async_added_to_hass()
+        last_state = await self.async_get_last_state()
+        if last_state is None:
+            return
+        try:
+            self._client.energy.restore(
+                float(last_state.state),
+                float(last_state.attributes.get(ATTR_ON_TIME, 0)),
+                float(last_state.attributes.get(ATTR_TOTAL_TIME, 0)),
+            )
+        except ValueError:
+            pass
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return "{} energy".format(self._client.name)
+
+    @property
+    def state(self):
+        """Return the estimated energy in kWh."""
+        return round(self._client.energy.energy_kwh, 3)
+
+    @property
+    def unit_of_measurement(self):
+        """Return kWh."""
+        return ENERGY_KILO_WATT_HOUR
+
+    @property
+    def device_class(self):
+        """Return the energy device class."""
+        return DEVICE_CLASS_ENERGY
+
+    @property
+    def state_class(self):
+        """Return total_increasing, the estimate only grows."""
+        return STATE_CLASS_TOTAL_INCREASING
+
+    @property
+    def device_state_attributes(self):
+        """Return the duty cycle and the totals it is computed from."""
+        energy = self._client.energy
+        duty_cycle = energy.duty_cycle
+        return {
+            ATTR_DUTY_CYCLE: round(duty_cycle, 3) if duty_cycle is not None else None,
+            ATTR_ON_TIME: round(energy.on_time),
+            ATTR_TOTAL_TIME: round(energy.total_time),
+        }
+
+
+class TerneoAXRequestsSensor(TerneoAXEntity, SensorEntity):
+    """Mean response time of a thermostat, with request counts and latencies per command as attributes.
+
+    It is written after every refresh attempt, so it keeps moving while the
+    device fails.  The histograms are left to ``client.metrics.as_dict()``.
+    """
+
+    _every_refresh = True
+
+    @property
+    def available(self):
+        """Return True, the metrics are most useful while the device is unreachable."""
+        return True
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return "{} response time".format(self._client.name)
+
+    @property
+    def state(self):
+        """Return the mean request latency in milliseconds."""
+        mean = self._client.metrics.mean_latency
+        return round(mean * 1000, 1) if mean is not None else None
+
+    @property
+    def unit_of_measurement(self):
+        """Return milliseconds."""
+        return TIME_MILLISECONDS
+
+    @property
+    def icon(self):
+        """Return the icon of the sensor."""
+        return "mdi:timer-outline"
+
+    @property
+    def device_state_attributes(self):
+        """Return the request counters and latencies per command type."""
+        metrics = self._client.metrics
+        return {
+            ATTR_REQUESTS: metrics.requests,
+            ATTR_ERRORS: metrics.errors,
+            **metrics.summary(),
+        }
+
+    def _published_value(self):
+        """Return the request count, the attributes move with it."""
+        return self._client.metrics.requests, self.state
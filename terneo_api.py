@@ -1,13 +1,42 @@
+import asyncio
 import json
+import aiohttp
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
 import logging
+import random
+import threading
+import zlib
 from collections import namedtuple
-from time import (time, sleep)
+from time import perf_counter, time
 import datetime
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+from .energy import EnergyEstimator, decode_power
+from .history import TelemetryHistory
+from .metrics import ERROR_CONNECTION, ERROR_HTTP, ERROR_TIMEOUT, RequestMetrics, command_of
+from .schedule import TerneoSchedule
+from .scheduler import DEFAULT_MAX_IN_FLIGHT, DeviceRequestQueue, RequestLimiter, default_limiter
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 TerneoParam = namedtuple('TerneoParam', ['readValue', 'setValue', 'type', 'divider'])
+TerneoState = namedtuple('TerneoState', ['mode', 'state', 'away', 'target_temperature', 'current_temperature',
+                                         'min_temperature', 'max_temperature', 'lan_control_enabled',
+                                         'next_transition'])
+
+SCHEDULE_MAX_AGE = 3600  # seconds before a cached schedule is checked again even without a hint of change
+PARAMS_MAX_AGE = 600  # default seconds before params are read again even without a hint of change
+
+# telemetry fields that follow the params; a change that neither our writes nor the
+# params explain means the params were changed on the device and are read early
+PARAMS_WATCH_FIELDS = ('typeOfManagement', 'lockType', 'currentSetting')
+
+TERNEO_EPOCH = datetime.datetime(2000, 1, 1).timestamp()  # device times count seconds from 01.01.2000
 
 terneo_params_map = {
     0: ("startAwayTime", 6),  # в секундах от 01.01.2000, время начала отъезда
@@ -68,6 +97,10 @@ terneo_params_map = {
 
 terneo_params_rev_map = {v[0]: (k, v[1]) for k, v in terneo_params_map.items()}
 
+terneo_param_ids = list(terneo_params_map.keys())
+terneo_param_id_slots = {param_id: slot for slot, param_id in enumerate(terneo_param_ids)}
+terneo_param_name_slots = {terneo_params_map[param_id][0]: slot for slot, param_id in enumerate(terneo_param_ids)}
+
 terneo_telemetry_map = {
     "t.0": ("internalOverheatSensor", 16),
     "t.1": ("floorSensor", 16),
@@ -140,6 +173,176 @@ terneo_telemetry_map = {
 terneo_telemetry_rev_map = {v[0]: (k, v[1]) for k, v in terneo_telemetry_map.items()}
 
 
+class TerneoTelemetry:
+    """Telemetry view over a raw cmd:4 response.
+
+    Fields are decoded with the divisors of terneo_telemetry_map on first
+    access and memoized, so the cost follows the fields that are actually read.
+    """
+
+    __slots__ = ('raw', '_decoded')
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+        self._decoded = {}
+
+    def get(self, name, default=None):
+        try:
+            return self._decoded[name]
+        except KeyError:
+            pass
+        key, divider = terneo_telemetry_rev_map.get(name, (None, None))
+        value = self.raw.get(key) if key is not None else None
+        if value is None:
+            return default
+        value = int(value) if divider is None else int(value) / divider
+        self._decoded[name] = value
+        return value
+
+    def __contains__(self, name):
+        key, _ = terneo_telemetry_rev_map.get(name, (None, None))
+        return key in self.raw
+
+    def items(self):
+        for key, (name, _) in terneo_telemetry_map.items():
+            if key in self.raw:
+                yield name, self.get(name)
+
+
+class TerneoParamRegisters:
+    """Register file of the device parameters.
+
+    Read values, set values and types live in preallocated lists indexed by the
+    slot of the parameter id in terneo_params_map.  Slots whose set value differs
+    from the value read from the device are tracked in ``dirty``.
+    """
+
+    __slots__ = ('read', 'set', 'types', 'dirty')
+
+    def __init__(self):
+        size = len(terneo_param_ids)
+        self.read = [None] * size
+        self.set = [None] * size
+        self.types = [terneo_params_map[param_id][1] for param_id in terneo_param_ids]
+        self.dirty = set()
+
+    def load(self, param_id, param_type, value) -> bool:
+        slot = terneo_param_id_slots.get(param_id)
+        if slot is None:
+            return False
+        self.read[slot] = value
+        self.types[slot] = param_type
+        if slot not in self.dirty:
+            self.set[slot] = value
+        elif self.set[slot] == value:
+            self.dirty.discard(slot)
+        return True
+
+    def get(self, name):
+        slot = terneo_param_name_slots.get(name)
+        if slot is None:
+            raise KeyError(name)
+        return self.set[slot]
+
+    def assign(self, name, value) -> bool:
+        slot = terneo_param_name_slots.get(name)
+        if slot is None:
+            return False
+        self.set[slot] = value
+        if value != self.read[slot]:
+            self.dirty.add(slot)
+        else:
+            self.dirty.discard(slot)
+        return True
+
+    def confirm(self, param_id, value) -> bool:
+        """Promote a written value to the read value unless it was changed since."""
+        slot = terneo_param_id_slots.get(param_id)
+        if slot is None or str(self.set[slot]) != value:
+            return False
+        self.read[slot] = self.set[slot]
+        self.dirty.discard(slot)
+        return True
+
+    def param(self, name) -> TerneoParam:
+        slot = terneo_param_name_slots[name]
+        return TerneoParam(self.read[slot], self.set[slot], self.types[slot], 0)
+
+    def changes(self) -> list:
+        return [[terneo_param_ids[slot], self.types[slot], str(self.set[slot])] for slot in sorted(self.dirty)]
+
+
+class CircuitBreaker:
+    """Failure tracking of one device with exponential backoff.
+
+    After ``threshold`` consecutive failures the breaker opens and polls are
+    skipped for a backoff delay that doubles with every further failure, up to
+    ``max_delay`` and with some jitter so a dead fleet is not probed in step.
+    When the delay has passed the breaker is half-open: a single cheap probe
+    decides whether it closes again or reopens with a longer delay.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=3, base_delay=10, max_delay=600, jitter=0.2):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time() < self.open_until:
+                return False
+            self.state = self.HALF_OPEN
+        return True
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0
+
+    def record_success(self) -> bool:
+        """Reset the failure count; True if the device just recovered."""
+        recovered = self.state != self.CLOSED
+        self.state = self.CLOSED
+        self.failures = 0
+        return recovered
+
+    def record_failure(self) -> bool:
+        """Count a failure; True if the breaker just opened."""
+        self.failures += 1
+        if self.failures < self.threshold:
+            return False
+        opened = self.state == self.CLOSED
+        delay = min(self.base_delay * 2 ** (self.failures - self.threshold), self.max_delay)
+        self.open_until = time() + delay * (1 + random.uniform(-self.jitter, self.jitter))
+        self.state = self.OPEN
+        return opened
+
+
+POOL_LIMIT = 32  # keep-alive connections kept open across all devices
+POOL_LIMIT_PER_HOST = 1  # the thermostat's HTTP stack serves one connection at a time
+KEEPALIVE_TIMEOUT = 30  # seconds an idle connection to a device is kept
+
+# blocking clients: requests in flight across all devices
+_sync_limiter = threading.BoundedSemaphore(DEFAULT_MAX_IN_FLIGHT)
+
+
+def create_session(limit=POOL_LIMIT, limit_per_host=POOL_LIMIT_PER_HOST,
+                   keepalive_timeout=KEEPALIVE_TIMEOUT) -> aiohttp.ClientSession:
+    """Create a bounded keep-alive session that can be shared by many AsyncTerneoAX clients."""
+    connector = aiohttp.TCPConnector(limit=limit,
+                                     limit_per_host=limit_per_host,
+                                     keepalive_timeout=keepalive_timeout)
+    return aiohttp.ClientSession(connector=connector)
+
+
 class TerneoAX:
     GET_PARAMS = {"cmd": 1}
     GET_SCHEDULE = {"cmd": 2}
@@ -154,180 +357,478 @@ class TerneoAX:
     TYPE_INT = 1
     TYPE_STR = 0
 
-    def __init__(self, addr, timeout=5, name=None):
+    def __init__(self, addr, timeout=5, name=None, settle_time=1, pool_maxsize=POOL_LIMIT_PER_HOST,
+                 params_interval=PARAMS_MAX_AGE):
         self.log = logging.getLogger(__name__)
 
         self.addr = addr
         self.timeout = timeout
+        self.settle_time = settle_time
+        self.params_interval = params_interval
+        self.pool_maxsize = pool_maxsize
         self._name = name
+        self._http = None
+        self._http_lock = threading.Lock()
+        self.breaker = CircuitBreaker()
+        self.history = TelemetryHistory()
+        self.energy = EnergyEstimator()
+        self.metrics = RequestMetrics()
+        # a recorder.TrafficRecorder to log the raw traffic to, off by default
+        self.recorder = None
 
         self._sn = None
         self._params = None
         self._telemetry = None
         self._schedule = None
+        self._schedule_digest = None
+        self._schedule_stale = True
+        self._schedule_checked_period = None
+        self.last_update_schedule = 0
+        self._snapshot = None
         self.last_update_params = 0
+        self.last_write = 0
+        self._settle_until = 0
+        self._reread_params = False
+        self._params_invalid = False
+        self.last_update_telemetry = 0
+        self.last_update_success = False
+        self.stale = False
+        self.changed = False
+        self._params_digest = None
+        self._telemetry_digest = None
 
     @property
     def name(self):
         if self._name is not None:
             return self._name
-        else:
+        elif self._sn is not None:
             return self._sn[0:5]
+        else:
+            return self.addr
+
+    def _get_http(self) -> requests.Session:
+        if self._http is None:
+            self._http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+            self._http.mount("http://", adapter)
+        return self._http
+
+    def close(self):
+        if self._http is not None:
+            self._http.close()
+            self._http = None
 
     def _request(self, path, data=None):
         uri = "http://{addr}/{path}".format(addr=self.addr, path=path)
+        http = self._get_http()
+        command = command_of(data)
+        payload = json.dumps(data) if data is not None else None
+        sent = len(payload) if payload is not None else 0
+        start = perf_counter()
         try:
-            if data is not None:
-                req = requests.post(uri,
+            # one request per device at a time, and a global cap on requests in flight
+            with self._http_lock, _sync_limiter:
+                start = perf_counter()
+                if payload is not None:
+                    req = http.post(uri,
                                     timeout=(int(self.timeout / 2), self.timeout),
-                                    data=json.dumps(data)
+                                    data=payload
                                     )
-            else:
-                req = requests.get(uri,
+                else:
+                    req = http.get(uri,
                                    timeout=(int(self.timeout / 2), self.timeout),
                                    )
         except Exception as ex:
-            self.log.error(
+            if isinstance(ex, requests.Timeout):
+                error = ERROR_TIMEOUT
+            else:
+                error = ERROR_CONNECTION
+            self._observe(data, command, sent, perf_counter() - start, error=error)
+            self._request_failed(
                 "Error requesting {uri} from Terneo AX. {data} {err}".format(uri=uri, err=str(ex), data=str(data)))
             return False
 
+        # requests reads the body before returning, elapsed stops at the response headers
+        total = perf_counter() - start
+        wait = min(req.elapsed.total_seconds(), total)
         if not req.ok:
-            self.log.error("Connection error logging into Terneo AX. Status Code: {status}".format(
+            self._observe(data, command, sent, wait, total - wait, req.content, error=ERROR_HTTP)
+            self._request_failed("Connection error logging into Terneo AX. Status Code: {status}".format(
                 status=req.status_code))
             return False
 
-        return req
+        self._observe(data, command, sent, wait, total - wait, req.content)
+        self._request_ok()
+        return req.content
 
-    def send_changed_params(self) -> bool:
+    def _observe(self, data, command, sent, wait, read=None, body=None, error=None):
+        """Count a finished request and pass it to the recorder, if any."""
+        self.metrics.record(command, sent, wait, read, len(body) if body is not None else 0, error)
+        if self.recorder is not None:
+            self.recorder.record(self.addr, data, body, wait + (read or 0), error)
+
+    def _request_failed(self, message):
+        if self.breaker.state == CircuitBreaker.CLOSED:
+            self.log.error(message)
+        else:
+            self.log.debug(message)
+        if self.breaker.record_failure():
+            self.log.warning("{} is unreachable, backing off polls after {} failures".format(
+                self.addr, self.breaker.failures))
+
+    def _request_ok(self):
+        if self.breaker.record_success():
+            self.log.warning("{} is reachable again".format(self.addr))
+
+    def _decode(self, body):
+        start = perf_counter()
+        try:
+            data = json_loads(body)
+        except ValueError as ex:
+            self.metrics.record_decode(perf_counter() - start, ok=False)
+            self.log.error("Json error: {err}".format(err=str(ex)))
+            return None
+        self.metrics.record_decode(perf_counter() - start)
+        return data
+
+    def _changed_params(self) -> list:
         if self._params is None:
-            return False
-        param: TerneoParam
-        updates = []
-        for key, param in self._params.items():
-            if param.readValue != param.setValue:
-                k, _ = terneo_params_rev_map.get(key, (None, None))
-                if k is not None:
-                    updates.append([k,
-                                    param.type,
-                                    str(param.setValue)])
-                else:
-                    self.log.error("error: key:{} not found in reverse map".format(key))
-        if len(updates):
-            self.log.info("{} updates: {}".format(self.addr, str(updates)))
-            data = {
-                "sn": self._sn,
-                "par": updates
-            }
-            r = self._request("api.cgi", data)
-            if r is False:
-                return False
+            return []
+        return self._params.changes()
 
-            try:
-                data = r.json()
-            except json.decoder.JSONDecodeError as ex:
-                self.log.error("Json error: {err}".format(err=str(ex)))
-                return False
-            self.log.info("{} Response: {}".format(self.addr, str(data)))
+    def _params_payload(self, updates) -> dict:
+        self.log.info("{} updates: {}".format(self.addr, str(updates)))
+        return {
+            "sn": self._sn,
+            "par": updates
+        }
+
+    def _apply_write_response(self, body, updates) -> bool:
+        data = self._decode(body)
+        if data is None:
+            return False
+        self.log.info("{} Response: {}".format(self.addr, str(data)))
+        if not isinstance(data, dict) or "success" not in data and "status" not in data:
+            # no clear acknowledgement, confirm the write with a full read
+            self._write_sent()
             return True
-        else:
+        if str(data.get("success", "")).lower() != "true":
+            # the device answered with an error, the params stay dirty for the next write
+            self.log.warning("{} rejected the write: {}".format(self.addr, str(data)))
             return False
+        for param_id, _, value in updates:
+            self._params.confirm(param_id, value)
+        self.last_write = time()
+        self._params_digest = None
+        self._snapshot = None
+        self.changed = True
+        return True
 
-    def update_params(self):
+    def _params_fresh(self) -> bool:
+        return time() - self.last_update_params < self.params_interval
 
-        if not self.send_changed_params() and (time() - self.last_update_params < 60):
-            return True
+    def _write_sent(self):
+        # the device applies a write with a short delay, so the confirming
+        # read is postponed until it has settled instead of sleeping on it
+        self.last_write = time()
+        self._settle_until = self.last_write + self.settle_time
+        self._reread_params = True
 
-        r = self._request("api.cgi", self.GET_PARAMS)
+    def _params_read_due(self) -> bool:
+        return self._reread_params or self._params_invalid or not self._params_fresh()
 
-        if r is False:
-            return False
+    @property
+    def settle_delay(self):
+        """Seconds until a post-write params read may run, None when not waiting."""
+        if not self._reread_params:
+            return None
+        delay = self._settle_until - time()
+        return delay if delay > 0 else None
 
-        try:
-            data = r.json()
-        except json.decoder.JSONDecodeError as ex:
-            self.log.error("Json error: {err}".format(err=str(ex)))
+    def _apply_params(self, body) -> bool:
+        digest = zlib.crc32(body)
+        if digest == self._params_digest:
+            # identical dump: registers already hold exactly these values
+            self.last_update_params = time()
+            self._reread_params = False
+            self._params_invalid = False
+            return True
+        data = self._decode(body)
+        if data is None:
             return False
+        self._params_digest = digest
+        self._schedule_stale = True
+        self.changed = True
 
         self._sn = data.get("sn", None)
-        params = data.get("par", [])
+        self._load_params(data.get("par", []))
+
+        self.last_update_params = time()
+        self._reread_params = False
+        self._params_invalid = False
+        self.stale = False
+        return True
 
+    def _load_params(self, params):
         if self._params is None:
-            self._params = {}
+            self._params = TerneoParamRegisters()
 
         for param in params:
-            key, _ = terneo_params_map.get(param[0], (None, None))
-            if key is not None:
-                if param[1] in [1, 2, 3, 4, 5, 6, 7]:  # type 0-string 1..7 int, unsigned int and bool
-                    param_value = int(param[2])
-                else:
-                    param_value = param[2]
-                param_type = param[1]
+            if param[1] in [1, 2, 3, 4, 5, 6, 7]:  # type 0-string 1..7 int, unsigned int and bool
+                param_value = int(param[2])
+            else:
+                param_value = param[2]
+            self._params.load(param[0], param[1], param_value)
+        self._snapshot = None
 
-                if key in self._params:
-                    tmp: TerneoParam = self._params[key]
-                    self._params[key] = tmp._replace(readValue=param_value)
-                else:
-                    self._params[key] = TerneoParam(param_value, param_value, param_type, 0)
+    def export_state(self) -> dict:
+        """Last known serial number, params and schedule, for restoring after a restart."""
+        state = {"sn": self._sn}
+        if self._params is not None:
+            state["par"] = [[terneo_param_ids[slot], self._params.types[slot], str(value)]
+                            for slot, value in enumerate(self._params.read) if value is not None]
+        if self._schedule is not None:
+            state["tt"] = self._schedule.tt
+        return state
+
+    def restore_state(self, state: dict):
+        """Seed the client with exported state; it stays ``stale`` until a params read succeeds or a refresh fails."""
+        self._sn = state.get("sn")
+        if state.get("par"):
+            self._load_params(state["par"])
+        if state.get("tt") is not None:
+            self._schedule = TerneoSchedule(state["tt"])
+            self._schedule_stale = True
+        self.stale = True
+
+    def _apply_telemetry(self, body) -> bool:
+        digest = zlib.crc32(body)
+        if digest != self._telemetry_digest:
+            data = self._decode(body)
+            if data is None:
+                return False
+            self._telemetry_digest = digest
+            self.changed = True
+            self._sn = data.get("sn", None)
+            previous, self._telemetry = self._telemetry, TerneoTelemetry(data)
+            self._snapshot = None
+            if previous is not None and self._params_contradicted(previous):
+                self.log.debug("{} settings changed on the device, reading params".format(self.addr))
+                self._params_invalid = True
+        now = time()
+        self.last_update_telemetry = now
+        self.history.record(now, self._telemetry)
+        self.energy.update(now, self._telemetry.get('loadCondition'), decode_power(self._param_value('power')))
 
-        self.last_update_params = time()
-        sleep(1)
         return True
 
+    def _params_contradicted(self, previous: TerneoTelemetry) -> bool:
+        """Whether watched telemetry moved in a way that neither our writes nor the params explain."""
+        changed = [name for name in PARAMS_WATCH_FIELDS if self._telemetry.get(name) != previous.get(name)]
+        if not changed or self._params is None:
+            return False
+        if self.last_write >= self.last_update_telemetry:
+            # our own write went out since the previous telemetry
+            return False
+        snapshot = self.snapshot
+        expected = {
+            'typeOfManagement': 4 if snapshot.away else {self.MODE_SCHEDULE: 0, self.MODE_HEAT: 3}.get(snapshot.mode),
+            'currentSetting': snapshot.target_temperature,
+        }
+        return any(name not in expected or self._telemetry.get(name) != expected[name] for name in changed)
+
+    def _apply_schedule(self, body) -> bool:
+        digest = zlib.crc32(body)
+        if digest != self._schedule_digest:
+            data = self._decode(body)
+            if data is None:
+                return False
+            self._schedule_digest = digest
+            self._sn = data.get("sn", None)
+            self._schedule = TerneoSchedule(data.get("tt", None) or {})
+            self._snapshot = None
+            self.changed = True
+        self._schedule_stale = False
+        self.last_update_schedule = time()
+
+        return True
+
+    def _schedule_due(self) -> bool:
+        if self.snapshot.mode != self.MODE_SCHEDULE:
+            return False
+        if self._schedule is None or self._schedule_stale:
+            return True
+        if time() - self.last_update_schedule > SCHEDULE_MAX_AGE:
+            return True
+        # the device reports its active period; a mismatch means the schedule was edited elsewhere
+        reported = self._telemetry_value('numberPeriodOfSchedule')
+        if reported is None or reported == self._schedule_checked_period:
+            return False
+        predicted = self._schedule.period_number(datetime.datetime.now(), self._param_value('maxSchedulePeriod'))
+        if predicted is None or predicted == reported:
+            return False
+        self._schedule_checked_period = reported
+        return True
+
+    def send_changed_params(self) -> bool:
+        updates = self._changed_params()
+        if not len(updates):
+            return False
+        r = self._request("api.cgi", self._params_payload(updates))
+        if r is False:
+            return False
+        return self._apply_write_response(r, updates)
+
+    def update_params(self):
+
+        if self.settle_delay is not None:
+            return True
+        # after an unacknowledged write the confirming read goes first, the write is not repeated blindly
+        if not self._reread_params and (self.send_changed_params() or not self._params_read_due()):
+            return True
+
+        r = self._request("api.cgi", self.GET_PARAMS)
+
+        if r is False:
+            return False
+
+        return self._apply_params(r)
+
     def update_telemetry(self):
         r = self._request("api.cgi", self.GET_TELEMETRY)
 
         if r is False:
             return r
-        try:
-            data = r.json()
-        except json.decoder.JSONDecodeError as ex:
-            self.log.error("Json error: {err}".format(err=str(ex)))
-            return False
-        self._sn = data.get("sn", None)
-        if self._telemetry is None:
-            self._telemetry = {}
-        for k, v in data.items():
-            key = terneo_telemetry_map.get(k, None)
-            if key is not None:
-                self._telemetry[key[0]] = int(v) if key[1] is None else int(v) / key[1]
-
-        return True
+        return self._apply_telemetry(r)
 
     def update_schedule(self):
         r = self._request("api.cgi", self.GET_SCHEDULE)
 
         if r is False:
             return r
-        data = r.json()
-        self._sn = data.get("sn", None)
-        self._schedule = data.get("tt", None)
+        return self._apply_schedule(r)
 
-        return True
+    def _refresh_started(self) -> bool:
+        """Reset the change flag; False while the breaker skips this device."""
+        self.changed = False
+        return self.breaker.allow()
+
+    def _probing(self) -> bool:
+        # a half-open breaker is tested with the cheap telemetry request only
+        return self.breaker.state == CircuitBreaker.HALF_OPEN
+
+    def _refresh_done(self, params_ok, telemetry_ok) -> bool:
+        log = self.log.error if self.breaker.state == CircuitBreaker.CLOSED else self.log.debug
+        if not params_ok:
+            log("{} Failed to update params".format(self.addr))
+        if not telemetry_ok:
+            log("{} Failed to update telemetry".format(self.addr))
+        if telemetry_ok != self.last_update_success:
+            self.changed = True
+        if not telemetry_ok and self.stale:
+            # restored state is shown until the device is polled, not while it stays unreachable
+            self.stale = False
+            self.changed = True
+        self.last_update_success = telemetry_ok
+        return telemetry_ok
+
+    def refresh(self) -> bool:
+        """Update params and telemetry; ``changed`` tells whether any decoded data differs."""
+        if not self._refresh_started():
+            return False
+        if self._probing():
+            return self._refresh_done(True, self.update_telemetry())
+        params_ok = self.update_params()
+        if self.breaker.state == CircuitBreaker.OPEN:
+            return self._refresh_done(params_ok, False)
+        telemetry_ok = self.update_telemetry()
+        if telemetry_ok and self._params_invalid:
+            params_ok = self.update_params()
+        if telemetry_ok and self._schedule_due() and not self.update_schedule():
+            self.log.warning("{} Failed to update schedule".format(self.addr))
+        return self._refresh_done(params_ok, telemetry_ok)
 
     def get_param(self, attr):
         if self._params is not None:
-            param: TerneoParam = self._params.get(attr, None)
-            if param is not None:
-                if param.setValue is None:
-                    self.log.warning("{} Param {} is None".format(self.addr, attr))
-                return param.setValue
-            else:
+            try:
+                value = self._params.get(attr)
+            except KeyError:
                 self.log.error("{} Param {} not found".format(self.addr, attr))
+                return None
+            if value is None:
+                self.log.warning("{} Param {} is None".format(self.addr, attr))
+            return value
         else:
             self.log.error("{} Params is None".format(self.addr))
 
     def set_param(self, attr, value) -> bool:
         # self.log.info("set param {} {} {}".format(self.addr, attr, value))
         if self._params is not None:
-            param: TerneoParam = self._params.get(attr, None)
-            if param is None:
-                _, type_attr = terneo_params_rev_map.get(attr, (None, None))
-                param = TerneoParam(None, None, type_attr, None)
-            self._params[attr] = param._replace(setValue=value)
-            return True
+            self._snapshot = None
+            return self._params.assign(attr, value)
         else:
             return False
 
+    def _param_value(self, attr):
+        return self._params.get(attr) if self._params is not None else None
+
+    def _telemetry_value(self, attr):
+        return self._telemetry.get(attr) if self._telemetry is not None else None
+
+    @property
+    def snapshot(self) -> TerneoState:
+        """Derived state of the device, rebuilt once after every update or local change."""
+        if self._snapshot is None or self._transition_passed(self._snapshot):
+            self._snapshot = self._build_snapshot()
+        return self._snapshot
+
+    @staticmethod
+    def _transition_passed(snapshot: TerneoState) -> bool:
+        return snapshot.next_transition is not None and datetime.datetime.now() >= snapshot.next_transition[0]
+
+    def _build_snapshot(self) -> TerneoState:
+        power_off = self._param_value('powerOff')
+        mode_param = self._param_value('mode')
+        if power_off == 1:
+            mode = self.MODE_OFF
+        elif mode_param == 0:
+            mode = self.MODE_SCHEDULE
+        elif mode_param == 1:
+            mode = self.MODE_HEAT
+        else:
+            mode = 'UNKNOWN'
+
+        cond = self._telemetry_value('loadCondition')
+        if power_off == 1:
+            state = self.MODE_OFF
+        elif cond == 0:
+            state = self.STATE_IDLE
+        elif cond == 1:
+            state = self.STATE_HEATING
+        else:
+            state = self.STATE_UNKNOWN
+
+        away = self._is_away_mode_now()
+        lock = self._telemetry_value('lockType')
+        target = self._param_value('awayFloorTemperature' if away else 'manualFloorTemperature')
+        next_transition = None
+        if mode == self.MODE_SCHEDULE and self._schedule:
+            now = datetime.datetime.now()
+            if not away:
+                target = self._schedule.setpoint_at(now)
+            next_transition = self._schedule.next_transition(now)
+        return TerneoState(
+            mode=mode,
+            state=state,
+            away=away,
+            target_temperature=target,
+            current_temperature=self._telemetry_value('floorSensor'),
+            min_temperature=self._param_value('lowerLimit'),
+            max_temperature=self._param_value('upperLimit'),
+            lan_control_enabled=(lock & 2) == 0 if lock is not None else True,
+            next_transition=next_transition,
+        )
+
     def get_telemetry(self, attr):
         if self._telemetry is not None:
             tele = self._telemetry.get(attr, None)
@@ -338,23 +839,20 @@ class TerneoAX:
             self.log.error("{} Telemetry is None".format(self.addr))
 
     def get_current_temp(self):
-        return self.get_telemetry('floorSensor')
+        return self.snapshot.current_temperature
 
     def get_upper_temp_limit(self):
-        return self.get_param('upperLimit')
+        return self.snapshot.max_temperature
 
     def get_lower_temp_limit(self):
-        return self.get_param('lowerLimit')
+        return self.snapshot.min_temperature
 
     @property
     def heattemp(self):
         return self.get_temp_setting()
 
     def get_temp_setting(self):
-        if self.away:
-            return self.get_param('awayFloorTemperature')
-        else:
-            return self.get_param('manualFloorTemperature')
+        return self.snapshot.target_temperature
 
     def set_temp_setting(self, temp) -> bool:
         if self.away:
@@ -369,27 +867,17 @@ class TerneoAX:
     def set_mode(self, mode):
         self.log.info("Set mode: {}".format(mode))
         if mode == self.MODE_OFF:
-            self.set_param('powerOff', 1)
+            return self.set_param('powerOff', 1)
         elif mode == self.MODE_HEAT:
-            self.set_param('powerOff', 0)
-            self.set_param('mode', 1)
+            return self.set_param('powerOff', 0) & self.set_param('mode', 1)
         elif mode == self.MODE_SCHEDULE:
-            self.set_param('powerOff', 0)
-            self.set_param('mode', 0)
+            return self.set_param('powerOff', 0) & self.set_param('mode', 0)
         else:
             return False
-        return True
 
     def get_current_mode(self):
         # OFF, HEAT, SCHEDULE, UNKNOWN
-        if self.get_param('powerOff') == 1:
-            return self.MODE_OFF
-        elif self.get_param('mode') == 0:
-            return self.MODE_SCHEDULE
-        elif self.get_param('mode') == 1:
-            return self.MODE_HEAT
-        else:
-            return 'UNKNOWN'
+        return self.snapshot.mode
 
     @property
     def state(self):
@@ -397,49 +885,200 @@ class TerneoAX:
 
     def get_current_state(self):
         # OFF IDLE HEATING UNKNOWN
-        if self.get_param('powerOff') == 1:
-            return self.MODE_OFF
-        cond = self.get_telemetry('loadCondition')
-        if cond == 0:
-            return self.STATE_IDLE
-        elif cond == 1:
-            return self.STATE_HEATING
-        return self.STATE_UNKNOWN
+        return self.snapshot.state
 
     @property
     def away(self) -> bool:
-        return self._is_away_mode_now()
+        return self.snapshot.away
 
     def set_home(self) -> bool:
-        self.set_param('startAwayTime', 536112000)
-        self.set_param('endAwayTime', 536112000)
-        return True
+        return self.set_param('startAwayTime', 536112000) & self.set_param('endAwayTime', 536112000)
 
     def set_away(self, away_time: int) -> bool:
-        beginTime = datetime.datetime.strptime("2000:01:01 00:00:00", "%Y:%m:%d %H:%M:%S").timestamp()
-        nowTime = int(time() - beginTime)
+        nowTime = int(time() - TERNEO_EPOCH)
         startAway = nowTime - 10
         endAway = nowTime + away_time
-        self.set_param('startAwayTime', startAway)
-        self.set_param('endAwayTime', endAway)
-        return True
+        return self.set_param('startAwayTime', startAway) & self.set_param('endAwayTime', endAway)
 
     @property
-    def schedule(self):
-        return 0
+    def schedule(self) -> TerneoSchedule:
+        return self._schedule
 
     def is_local_lan_remote_control_enabled(self) -> bool:
-        flag = self.get_telemetry('lockType')
-        # self.log.info("Remote control {} {}".format(self.addr, flag))
-        if flag is not None:
-            return (flag & 2) == 0
-        return True
+        return self.snapshot.lan_control_enabled
 
     def _is_away_mode_now(self):
-        startAway = self.get_param('startAwayTime')
-        endAway = self.get_param('endAwayTime')
-        beginTime = datetime.datetime.strptime("2000:01:01 00:00:00", "%Y:%m:%d %H:%M:%S").timestamp()
-        nowTime = int(time() - beginTime)
+        startAway = self._param_value('startAwayTime')
+        endAway = self._param_value('endAwayTime')
+        nowTime = int(time() - TERNEO_EPOCH)
         if startAway is not None and endAway is not None:
             return startAway < nowTime and nowTime < endAway
         return False
+
+
+async def async_probe(session: aiohttp.ClientSession, addr, timeout=2):
+    """Return the serial number of a Terneo AX answering cmd:4 at addr, None otherwise."""
+    uri = "http://{addr}/api.cgi".format(addr=addr)
+    # no total timeout: time spent waiting for a free connection must not count against the device
+    probe_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    try:
+        async with session.post(uri, timeout=probe_timeout,
+                                data=json.dumps(TerneoAX.GET_TELEMETRY)) as resp:
+            if resp.status >= 400:
+                return None
+            data = json_loads(await resp.read())
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        return None
+    return data.get("sn") if isinstance(data, dict) else None
+
+
+class AsyncTerneoAX(TerneoAX):
+    """TerneoAX client running on the asyncio event loop.
+
+    Shares all decoding and parameter bookkeeping with TerneoAX; only the
+    transport and the update methods, which are coroutines here, differ.
+    """
+
+    def __init__(self, addr, timeout=5, name=None, settle_time=1, pool_maxsize=POOL_LIMIT_PER_HOST,
+                 params_interval=PARAMS_MAX_AGE, session: aiohttp.ClientSession = None, write_debounce=0.3,
+                 limiter: RequestLimiter = None):
+        super().__init__(addr, timeout=timeout, name=name, settle_time=settle_time, pool_maxsize=pool_maxsize,
+                         params_interval=params_interval)
+        self._session = session
+        self._own_session = session is None
+        self._queue = DeviceRequestQueue(limiter if limiter is not None else default_limiter())
+        self.write_debounce = write_debounce
+        self._write_lock = asyncio.Lock()
+        self._write_waiters = []
+        self._write_task = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = create_session(limit=self.pool_maxsize, limit_per_host=self.pool_maxsize)
+            self._own_session = True
+        return self._session
+
+    async def close(self):
+        if self._own_session and self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, path, data=None):
+        write = data is not None and "par" in data
+        return await self._queue.submit(self._send, path, data, write=write)
+
+    async def _send(self, path, data=None):
+        uri = "http://{addr}/{path}".format(addr=self.addr, path=path)
+        timeout = aiohttp.ClientTimeout(total=self.timeout, connect=int(self.timeout / 2))
+        session = self._get_session()
+        command = command_of(data)
+        payload = json.dumps(data) if data is not None else None
+        sent = len(payload) if payload is not None else 0
+        start = perf_counter()
+        wait = None
+        try:
+            if payload is not None:
+                req = session.post(uri, timeout=timeout, data=payload)
+            else:
+                req = session.get(uri, timeout=timeout)
+            async with req as resp:
+                wait = perf_counter() - start
+                body = await resp.read()
+                read = perf_counter() - start - wait
+                if resp.status >= 400:
+                    self._observe(data, command, sent, wait, read, body, error=ERROR_HTTP)
+                    self._request_failed("Connection error logging into Terneo AX. Status Code: {status}".format(
+                        status=resp.status))
+                    return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            elapsed = perf_counter() - start
+            error = ERROR_TIMEOUT if isinstance(ex, asyncio.TimeoutError) else ERROR_CONNECTION
+            if wait is None:
+                self._observe(data, command, sent, elapsed, error=error)
+            else:
+                self._observe(data, command, sent, wait, elapsed - wait, error=error)
+            self._request_failed(
+                "Error requesting {uri} from Terneo AX. {data} {err}".format(uri=uri, err=repr(ex), data=str(data)))
+            return False
+        self._observe(data, command, sent, wait, read, body)
+        self._request_ok()
+        return body
+
+    async def send_changed_params(self) -> bool:
+        async with self._write_lock:
+            updates = self._changed_params()
+            if not len(updates):
+                return False
+            r = await self._request("api.cgi", self._params_payload(updates))
+            if r is False:
+                return False
+            return self._apply_write_response(r, updates)
+
+    def queue_write(self) -> asyncio.Future:
+        """Flush pending set_param changes after the debounce window.
+
+        Every change made inside the window goes out in a single "par" write.
+        The returned future resolves to True once that write was acknowledged,
+        or to False if it failed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._write_waiters.append(future)
+        if self._write_task is None:
+            self._write_task = loop.create_task(self._flush_writes())
+        return future
+
+    async def _flush_writes(self):
+        await asyncio.sleep(self.write_debounce)
+        waiters, self._write_waiters = self._write_waiters, []
+        self._write_task = None
+        if len(self._changed_params()):
+            success = await self.send_changed_params()
+        else:
+            success = True
+        for future in waiters:
+            if not future.done():
+                future.set_result(success)
+
+    async def update_params(self):
+
+        if self.settle_delay is not None or self._write_task is not None:
+            return True
+        if not self._reread_params and (await self.send_changed_params() or not self._params_read_due()):
+            return True
+
+        r = await self._request("api.cgi", self.GET_PARAMS)
+
+        if r is False:
+            return False
+
+        return self._apply_params(r)
+
+    async def update_telemetry(self):
+        r = await self._request("api.cgi", self.GET_TELEMETRY)
+
+        if r is False:
+            return r
+        return self._apply_telemetry(r)
+
+    async def update_schedule(self):
+        r = await self._request("api.cgi", self.GET_SCHEDULE)
+
+        if r is False:
+            return r
+        return self._apply_schedule(r)
+
+    async def refresh(self) -> bool:
+        if not self._refresh_started():
+            return False
+        if self._probing():
+            return self._refresh_done(True, await self.update_telemetry())
+        params_ok = await self.update_params()
+        if self.breaker.state == CircuitBreaker.OPEN:
+            return self._refresh_done(params_ok, False)
+        telemetry_ok = await self.update_telemetry()
+        if telemetry_ok and self._params_invalid:
+            params_ok = await self.update_params()
+        if telemetry_ok and self._schedule_due() and not await self.update_schedule():
+            self.log.warning("{} Failed to update schedule".format(self.addr))
+        return self._refresh_done(params_ok, telemetry_ok)
@@ -0,0 +1,11 @@
+"""Import the component modules without the Home Assistant glue of its __init__."""
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+if "terneoax" not in sys.modules:
+    package = types.ModuleType("terneoax")
+    package.__path__ = [str(ROOT)]
+    sys.modules["terneoax"] = package
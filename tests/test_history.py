@@ -0,0 +1,75 @@
+"""Tests of the telemetry history rings and aggregates."""
+from terneoax.history import RESOLUTION_MINUTE, RESOLUTION_QUARTER, RESOLUTION_RAW, TelemetryHistory, _Ring
+
+NOW = 1_700_000_000.0
+
+
+def _history(samples, resolutions=None):
+    history = TelemetryHistory(fields=('floorSensor',), resolutions=resolutions)
+    for ts, value in samples:
+        history.record(ts, {'floorSensor': value})
+    return history
+
+
+def test_ring_buckets_fold_samples():
+    ring = _Ring(60, 4, 1)
+    for ts, value in ((NOW, 1.0), (NOW + 10, 3.0), (NOW + 70, 5.0)):
+        ring.add(ts, [value])
+    assert ring.length == 2
+    newest, older = list(ring.slots(0))
+    assert (ring.counts[older], ring.sums[older], ring.mins[older], ring.maxs[older]) == (2, 4.0, 1.0, 3.0)
+    assert (ring.counts[newest], ring.sums[newest]) == (1, 5.0)
+
+
+def test_ring_wraps_and_keeps_the_newest_buckets():
+    ring = _Ring(0, 3, 1)
+    for n in range(5):
+        ring.add(NOW + n, [float(n)])
+    assert ring.wrapped
+    assert ring.oldest == NOW + 2
+    assert [ring.sums[slot] for slot in ring.slots(0)] == [4.0, 3.0, 2.0]
+
+
+def test_ring_slots_include_the_bucket_overlapping_since():
+    ring = _Ring(60, 4, 1)
+    ring.add(NOW - NOW % 60, [1.0])
+    assert len(list(ring.slots(NOW - NOW % 60 + 30))) == 1
+    assert not list(ring.slots(NOW - NOW % 60 + 60))
+
+
+def test_ring_skips_missing_values():
+    ring = _Ring(0, 2, 2)
+    ring.add(NOW, [None, 2.0])
+    slot = next(ring.slots(0))
+    assert (ring.counts[slot * 2], ring.counts[slot * 2 + 1]) == (0, 1)
+
+
+def test_aggregate_of_a_window_longer_than_the_history():
+    history = _history((NOW - 4 + n, 20.0 + n) for n in range(5))
+    aggregate = history.aggregate('floorSensor', 60, NOW)
+    assert aggregate == (5, 22.0, 20.0, 24.0)
+    assert history.aggregate('floorSensor', 60, NOW, resolution=RESOLUTION_RAW) == aggregate
+
+
+def test_aggregate_uses_the_finest_ring_covering_the_window():
+    history = _history((NOW - 600 + 15 * n, float(n)) for n in range(41))
+    # the raw ring covers the last minute exactly
+    assert history.aggregate('floorSensor', 60, NOW).count == 5
+
+
+def test_aggregate_falls_back_to_coarser_rings_once_raw_wrapped():
+    resolutions = {RESOLUTION_RAW: 10, RESOLUTION_MINUTE: 100, RESOLUTION_QUARTER: 10}
+    history = _history(((NOW - 3600 + 30 * n, 1.0) for n in range(121)), resolutions)
+    assert history.aggregate('floorSensor', 1800, NOW).count >= 60
+    assert history.aggregate('floorSensor', 1800, NOW, resolution=RESOLUTION_RAW).count == 10
+
+
+def test_aggregate_of_an_empty_history():
+    assert TelemetryHistory().aggregate('floorSensor', 60, NOW) == (0, None, None, None)
+
+
+def test_series_is_oldest_first():
+    history = _history((NOW - 180 + 60 * n, float(n)) for n in range(4))
+    points = history.series('floorSensor', RESOLUTION_MINUTE, 300, NOW)
+    assert [value for _, value in points] == [0.0, 1.0, 2.0, 3.0]
+    assert points == sorted(points)